@@ -1,80 +1,69 @@
 # URGENT FIX \n
 # CONVERT \n to selenium KEY shift+enter
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
-
-import csv
 import os
 import sys
 import time
 import asyncio
 
+from whatsapp_hooks import MessageHook, ChatListWatcher
+from whatsapp_extract import extract_messages, load_history
+from chat_export import ChatExporter
+from archive import get_archive
+from browser_manager import get_browser
+from whatsapp_send import insert_message
+from lazy_import import lazy
+from waits import all_of, any_of, dom_stable, element_clickable, element_present, element_visible, wait_for
 
-print("User data will be saved in: {}".format(
-    os.path.join(sys.path[0], "UserData")))
+# selenium.webdriver pulls in every browser driver; loaded on first use
+By = lazy("selenium.webdriver.common.by", "By")
+WebDriverWait = lazy("selenium.webdriver.support.wait", "WebDriverWait")
+EC = lazy("selenium.webdriver.support.expected_conditions")
+Keys = lazy("selenium.webdriver.common.keys", "Keys")
+ActionChains = lazy("selenium.webdriver.common.action_chains", "ActionChains")
+
+
+# Seconds between chat list scans while no monitored chat is open
+CHAT_SCAN_INTERVAL = 0.5
 
 
 class Whatsapp:
-    def __init__(self, executable_path=None, silent=False, headless=False):
-        self.options = webdriver.ChromeOptions()
-        if silent:
-            self.__addOption("--log-level=3")
-        if headless:
-            self.__addOption("--headless")
-            self.__addOption("--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36")
-            self.__addOption("--window-size=1920,1080")
-            self.__addOption("--no-sandbox")
-
-
-        self.__addOption(
-            "user-data-dir={}".format(os.path.join(sys.path[0], "UserData")))
-
-        if executable_path:
-            self.browser = webdriver.Chrome(
-                options=self.options, executable_path=executable_path)
-        else:
-            self.browser = webdriver.Chrome(options=self.options)
+    def __init__(self, executable_path=None, silent=False, headless=False, role="main"):
+        self.chatHandlers = {}
+        # One warm Chrome is shared with the Gmail automation; this bot drives its WhatsApp tab
+        self.browserManager = get_browser(role, executable_path, silent, headless)
+        self.browser = self.browserManager.tab_driver("whatsapp")
 
     def test(self):
         self.browser.get('https://www.google.com')
         print(self.browser.title)
 
-    def __addOption(self, option):
-        self.options.add_argument(option)
-
     def login(self):
         self.browser.get('https://web.whatsapp.com')
         if not self.__isLogin():
             print("Please scan the QR code")
-            print("After 3 sec - Screenshot of QR code will be saved in: {}".format(
+            print("Once it is drawn - Screenshot of QR code will be saved in: {}".format(
                 os.path.join(sys.path[0], "QRCode.png")))
-            time.sleep(3)
+            wait_for(self.browser, all_of(element_visible(By.TAG_NAME, "canvas"), dom_stable(500)),
+                     stage="whatsapp.qr_code", required=False)
             self.browser.save_screenshot(
                 os.path.join(sys.path[0], "QRCode.png"))
-            while not self.__isLogin():
+            while not wait_for(self.browser, element_present(By.CLASS_NAME, "two"), timeout=60, required=False):
                 pass
             print("Login successful")
+            # Lets a wiped profile come back logged in
+            self.browserManager.profile.snapshot()
         else:
             print("Already logged in")
+            if not os.path.isdir(self.browserManager.profile.snapshot_path):
+                self.browserManager.profile.snapshot()
 
     def __isLogin(self):
-        try:
-            # Landing Page (Login QR Code page)
-            self.browser.find_element(By.CLASS_NAME, "landing-wrapper")
-        except:
-            try:
-                # Logged in (Chat list)
-                self.browser.find_element(By.CLASS_NAME, "two")
-                return True
-            except:
-                time.sleep(3)
-                self.__isLogin()
-        return False
+        # Landing Page (Login QR Code page) or Logged in (Chat list), whichever loads first
+        page = wait_for(self.browser, any_of(
+            element_present(By.CLASS_NAME, "landing-wrapper"),
+            element_present(By.CLASS_NAME, "two")), timeout=60, stage="whatsapp.load", required=False)
+        return bool(page) and "two" in (page.get_attribute("class") or "").split()
 
     def __wait(self, cName, timeout=60):
         print("Waiting for element: {}".format(cName),
@@ -87,23 +76,13 @@ class Whatsapp:
             exit("Element not found")
         return element
 
-    def __saveToCSV(self, data, name):
-        fileName = name + ".csv"
-        with open(fileName, 'w', encoding="utf-8", newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(("Date", "Sender", "Message",
-                            "Replied To", "Replied Message"))
-            writer.writerows(data)
-            # for item in data:
-            #     writer.writerows(item[0], item[1], item[2], item[3])
-
     def __search(self, query):
         self.browser.find_element(
             By.CLASS_NAME, "copyable-text").send_keys(query)
         self.browser.save_screenshot(
                 os.path.join(sys.path[0], "Searched !.png"))
-        time.sleep(0.25)
-        return self.browser.find_element(By.CLASS_NAME,"matched-text")
+        return wait_for(self.browser, element_present(By.CLASS_NAME, "matched-text"),
+                        timeout=5, stage="whatsapp.search")
 
     def __scrollToTop(self, e):
         e[0].click()
@@ -111,38 +90,21 @@ class Whatsapp:
     def __scrollToBottom(self, e):
         pass
 
-# Scroll up waiting for DOM to not change anymore. Means we reached the top
-# Incremental waits of 1 and 3 seconds are used to avoid false positives
     def __sendPageUP(self, count):
         for i in range(count):
             ActionChains(self.browser).send_keys(Keys.PAGE_UP).perform()
             time.sleep(0.1)
 
-    def __scrollToView(self, e):
-        ee = self.browser.find_elements(By.CLASS_NAME, e)
-        ee[0].click()
-        while True:
-            self.__sendPageUP(5)
-            oldPage = self.browser.page_source
-            if oldPage == self.browser.page_source:
-                time.sleep(1)
-                self.__sendPageUP(10)
-                oldPage = self.browser.page_source
-                if oldPage == self.browser.page_source:
-                    time.sleep(3)
-                    self.__sendPageUP(30)
-                    oldPage = self.browser.page_source
-                    if oldPage == self.browser.page_source:
-                        time.sleep(10)
-                        self.__sendPageUP(60)
-                        oldPage = self.browser.page_source
-                        if oldPage == self.browser.page_source:
-                            break
+# Scroll up until the message count and oldest message id stop changing at the top,
+# or until the date / count bound is reached
+    def __scrollToView(self, e, since=None, limit=None, on_window=None):
+        return load_history(self.browser, e, since=since, limit=limit, on_window=on_window)
 
     def __scroll(self, count, e):
         for i in range(count):
             self.__sendPageUP(10)
-            time.sleep(1.5)
+            # Older messages finished rendering
+            wait_for(self.browser, dom_stable(500), timeout=5, stage="whatsapp.history", required=False)
 
 
 ###################################### READ MESSAGES #######################################
@@ -164,40 +126,50 @@ class Whatsapp:
     def __getChatName(self):
         return self.browser.find_element(By.CLASS_NAME, "_3W2ap").text
 
-    def getMessages(self, chatName, all=False, scroll=None, manualSync=False, element="_1AOLJ._1jHIY"):
+    def getMessages(self, chatName, all=False, scroll=None, manualSync=False, element="_1AOLJ._1jHIY", since=None, limit=None):
         self.__openChat(chatName)
         
         self.__wait(element)
 
         self.browser.find_elements(By.CLASS_NAME, element)[0].click()
 
-        if manualSync:
-            print("Please sync manually | Press Enter to continue")
-            input()
-        else:
-            if scroll:
-                self.__scroll(scroll, element)
+        # Rows are appended to <chat>.csv and the archive window by window,
+        # so a crash keeps what was read
+        name = self.__getChatName()
+        with ChatExporter(name + ".csv") as exporter:
+            self.__exportWindow(exporter, name, element)
 
-            if all:
-                self.__scrollToView(element)
+            if manualSync:
+                print("Please sync manually | Press Enter to continue")
+                input()
+            else:
+                if scroll:
+                    self.__scroll(scroll, element)
 
-        time.sleep(3)
-        messages = self.browser.find_elements(By.CLASS_NAME, element)
+                if all or since or limit:
+                    self.__scrollToView(element, since, limit, lambda oldest: self.__exportWindow(
+                        exporter, name, element, oldest))
 
-        fetchedMessages = []
-        for message in messages:
-            msg = self.__parseMessage(message)
-            fetchedMessages.append(msg)
-            print(msg)
-            print("------------------")
+            if manualSync or scroll:
+                wait_for(self.browser, dom_stable(500), stage="whatsapp.history", required=False)
+                self.__exportWindow(exporter, name, element)
 
-        self.__saveToCSV(fetchedMessages, self.__getChatName())
+            print("Exported {} new messages to {}".format(exporter.written, exporter.path))
 
-    def getMessagesOutgoing(self, chatName, all=False, scroll=None, manualSync=False):
-        self.getMessages(chatName, all, scroll, manualSync, "message-out")
+    def __exportWindow(self, exporter, chatName, element, before=None):
+        # One script call per window; the per-element parser is the fallback
+        rows = extract_messages(self.browser, className=element, before=before, with_ids=True)
+        if rows is None:
+            rows = [self.__parseMessage(message)
+                    for message in self.browser.find_elements(By.CLASS_NAME, element)]
+        exporter.write(rows)
+        get_archive().add_messages(chatName, rows)
 
-    def getMessagesIncomming(self, chatName, all=False, scroll=None, manualSync=False):
-        self.getMessages(chatName, all, scroll, manualSync, "message-in")
+    def getMessagesOutgoing(self, chatName, all=False, scroll=None, manualSync=False, since=None, limit=None):
+        self.getMessages(chatName, all, scroll, manualSync, "message-out", since, limit)
+
+    def getMessagesIncomming(self, chatName, all=False, scroll=None, manualSync=False, since=None, limit=None):
+        self.getMessages(chatName, all, scroll, manualSync, "message-in", since, limit)
 
     # Call given function with every new incomming message
 
@@ -207,20 +179,74 @@ class Whatsapp:
 
     async def __hookIncomming(self, chatName, func):
         self.__openChat(chatName)
-        time.sleep(0.1)
         self.browser.save_screenshot(os.path.join(sys.path[0], "Waiting.png"))
         self.__wait("message-in")
 
-        message = self.browser.find_elements(By.CLASS_NAME, "message-in")[-1]
+        # New messages are buffered page-side and handed over in one long-poll call
+        hook = MessageHook(self.browser, "message-in")
+        hook.install()
 
         while True:
-            while self.oldHookedMessage == message:
-                await asyncio.sleep(0.1)
-                message = self.browser.find_elements(
-                    By.CLASS_NAME, "message-in")[-1]
+            messages = hook.drain()
+            for message, parsed in zip(messages, self.__parseMessages(messages)):
+                await asyncio.create_task(func(message, parsed))
+                self.oldHookedMessage = message
+            await asyncio.sleep(0)
+
+    # Watch many chats from this one browser: the chat list is scanned for unread badges
+    # and a chat is only opened when it has new messages for its registered handler
 
-            await asyncio.create_task(func(message, self.__parseMessage(message)))
-            self.oldHookedMessage = message
+    def registerChat(self, chatName, func):
+        self.chatHandlers[chatName] = func
+
+    def hookChats(self, handlers=None):
+        for chatName, func in (handlers or {}).items():
+            self.registerChat(chatName, func)
+        asyncio.run(self.__hookChats())
+
+    async def __hookChats(self):
+        self.__wait("two")
+        watcher = ChatListWatcher(self.browser)
+        hooks = {}
+        current = None
+
+        while True:
+            # The open chat never shows an unread badge, so its hook is drained directly
+            if current:
+                await self.__dispatchHooked(current, hooks[current])
+                if not self.__isChatOpen(current):
+                    current = None
+            else:
+                await asyncio.sleep(CHAT_SCAN_INTERVAL)
+
+            for chatName, unread, row in watcher.unread(self.chatHandlers):
+                if chatName == current:
+                    continue
+                try:
+                    row.click()
+                except:
+                    self.__openChat(chatName)
+                self.__wait("message-in")
+
+                if chatName not in hooks:
+                    hooks[chatName] = MessageHook(self.browser, "message-in")
+                    hooks[chatName].install(backlog=unread)
+                current = chatName
+                await self.__dispatchHooked(current, hooks[current])
+                if not self.__isChatOpen(current):
+                    current = None
+
+    async def __dispatchHooked(self, chatName, hook):
+        messages = hook.drain()
+        for message, parsed in zip(messages, self.__parseMessages(messages)):
+            await asyncio.create_task(self.chatHandlers[chatName](message, parsed))
+
+    def __isChatOpen(self, chatName):
+        # Handlers may navigate to other chats
+        try:
+            return self.__getChatName().lower() == chatName.lower()
+        except:
+            return True
 
     def replyTo(self, element, msg):
         totalretries = 5
@@ -232,14 +258,14 @@ class Whatsapp:
                     element.find_elements(By.CLASS_NAME, "l7jjieqr.fewfhwl7")[0]).click().perform()
     
                 # Click Dropdown
-                dropDown = self.browser.find_element_by_xpath("//div[@aria-label='More']")
+                dropDown = wait_for(self.browser, element_clickable(By.XPATH, "//div[@aria-label='More']"),
+                                    timeout=2)
                 ActionChains(self.browser).move_to_element(
                     dropDown).click().perform()
     
-                # Click Reply
-                time.sleep(0.1)  # Wait for the reply button to appear
-    
-                replyButton = self.browser.find_element_by_xpath("//div[@aria-label='Reply']")
+                # Click Reply once the menu shows it
+                replyButton = wait_for(self.browser, element_clickable(By.XPATH, "//div[@aria-label='Reply']"),
+                                       timeout=2)
                 replyButton.click()
     
                 # Send the message
@@ -252,6 +278,15 @@ class Whatsapp:
                 pass
 
     def sendMessage(self, msg):
+        # The whole message goes in with one paste (or CDP insertText) call
+        if not insert_message(self.browser, msg):
+            self.__typeMessage(msg)
+
+        # Send the message with Enter key
+        ActionChains(self.browser).send_keys(Keys.RETURN).perform()
+
+    def __typeMessage(self, msg):
+        # Slow path: type line by line with Shift+Enter between lines
         # Click on message box
         myElem = self.browser.find_element(
             By.XPATH,"//div[@class='x9f619 x12lumcd x1qrby5j xeuugli xisnujt x6prxxf x1fcty0u x1fc57z9 xe7vic5 x1716072 xgde2yp x89wmna xbjl0o0 x13fuv20 xu3j5b3 x1q0q8m5 x26u7qi x178xt8z xm81vs4 xso031l xy80clv x1lq5wgf xgqcy7u x30kzoy x9jhf4c x1a2a7pz x13w7htt x78zum5 x96k8nx xdvlbce x1ye3gou xn6708d x1ok221b xu06os2 x1i64zmx x1emribx']")
@@ -267,9 +302,13 @@ class Whatsapp:
             # Only add Shift+Enter if it's NOT the last line
             if i < len(lines) - 1:
                 ActionChains(self.browser).key_down(Keys.SHIFT).send_keys(Keys.RETURN).key_up(Keys.SHIFT).perform()
-    
-        # Send the message with Enter key
-        ActionChains(self.browser).send_keys(Keys.RETURN).perform()
+
+    def __parseMessages(self, messages):
+        parsed = extract_messages(self.browser, messages)
+        if parsed is None:
+            parsed = [self.__parseMessage(message) for message in messages]
+        return parsed
+
     def __parseMessage(self, message):
         try:
             msg = message.find_element(
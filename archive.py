@@ -0,0 +1,274 @@
+import csv
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from whatsapp_extract import parse_plain_timestamp
+
+
+COLUMNS = ("Date", "Sender", "Message", "Replied To", "Replied Message", "Message ID")
+SEARCH_RESULTS = 5
+
+# External-content FTS5 indexes kept in step with their tables by triggers
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE messages_fts USING fts5(text, sender, content='messages', content_rowid='rowid')",
+    """CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, text, sender) VALUES (new.rowid, new.text, new.sender);
+    END""",
+    """CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, text, sender) VALUES ('delete', old.rowid, old.text, old.sender);
+    END""",
+    "CREATE VIRTUAL TABLE emails_fts USING fts5(subject, sender, body, content='emails', content_rowid='id')",
+    """CREATE TRIGGER emails_fts_insert AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts (rowid, subject, sender, body) VALUES (new.id, new.subject, new.sender, new.body);
+    END""",
+    """CREATE TRIGGER emails_fts_update AFTER UPDATE ON emails BEGIN
+        INSERT INTO emails_fts (emails_fts, rowid, subject, sender, body)
+            VALUES ('delete', old.id, old.subject, old.sender, old.body);
+        INSERT INTO emails_fts (rowid, subject, sender, body) VALUES (new.id, new.subject, new.sender, new.body);
+    END""",
+    """CREATE TRIGGER emails_fts_delete AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts (emails_fts, rowid, subject, sender, body)
+            VALUES ('delete', old.id, old.subject, old.sender, old.body);
+    END""",
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    "INSERT INTO emails_fts (emails_fts) VALUES ('rebuild')",
+)
+
+
+class MessageArchive:
+    """Local SQLite store of exported WhatsApp chats and fetched emails"""
+
+    def __init__(self, path):
+        self.path = path
+        self.__chatIds = {}
+        with self.__connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS chats (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE
+                )""")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY,
+                    chat_id INTEGER NOT NULL REFERENCES chats (id),
+                    date TEXT,
+                    sender TEXT,
+                    text TEXT,
+                    replied_to TEXT,
+                    replied_msg TEXT,
+                    sent_at REAL,
+                    archived REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS messages_chat ON messages (chat_id, sent_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender)")
+            db.execute("CREATE INDEX IF NOT EXISTS messages_sent_at ON messages (sent_at)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS emails (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message_id TEXT UNIQUE,
+                    mailbox TEXT,
+                    uid INTEGER,
+                    subject TEXT,
+                    sender TEXT,
+                    date TEXT,
+                    sent_at REAL,
+                    body TEXT,
+                    archived REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS emails_sender ON emails (sender)")
+            db.execute("CREATE INDEX IF NOT EXISTS emails_sent_at ON emails (sent_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS emails_mailbox ON emails (mailbox, uid)")
+            self.fts = self.__createSearchIndex(db)
+            self.__keyAnonymousEmails(db)
+
+    @staticmethod
+    def __createSearchIndex(db):
+        if db.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+            return True
+        try:
+            db.execute("SAVEPOINT fts")
+            for statement in FTS_SCHEMA:
+                db.execute(statement)
+            db.execute("RELEASE fts")
+            return True
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: search falls back to LIKE scans
+            db.execute("ROLLBACK TO fts")
+            db.execute("RELEASE fts")
+            print(f"[Archive] Full-text index unavailable: {e}")
+            return False
+
+    @contextmanager
+    def __connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def __chatId(self, db, chatName):
+        if chatName not in self.__chatIds:
+            db.execute("INSERT OR IGNORE INTO chats (name) VALUES (?)", (chatName,))
+            self.__chatIds[chatName] = db.execute(
+                "SELECT id FROM chats WHERE name = ?", (chatName,)).fetchone()[0]
+        return self.__chatIds[chatName]
+
+    @staticmethod
+    def __messageId(chatName, row):
+        # Rows from the per-element parser carry no data-id
+        if len(row) > 5 and row[5]:
+            return row[5]
+        digest = hashlib.sha1("\0".join((chatName,) + tuple(row[:5])).encode("utf-8"))
+        return "local:" + digest.hexdigest()
+
+    def add_messages(self, chatName, rows, date_format="%m/%d/%Y"):
+        """Store extracted message tuples in one transaction; returns how many were new"""
+        now = time.time()
+        records = []
+        for row in rows:
+            row = tuple(row)
+            stamp = parse_plain_timestamp(row[6], date_format) if len(row) > 6 else None
+            records.append((self.__messageId(chatName, row), row[0], row[1], row[2], row[3], row[4],
+                            stamp.timestamp() if stamp else None, now))
+        if not records:
+            return 0
+        with self.__connect() as db:
+            chatId = self.__chatId(db, chatName)
+            # rowcount leaves out the FTS trigger's writes, unlike total_changes
+            cursor = db.executemany(
+                "INSERT OR IGNORE INTO messages (id, chat_id, date, sender, text, replied_to, replied_msg, "
+                "sent_at, archived) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r[0], chatId) + r[1:] for r in records])
+            return cursor.rowcount
+
+    @staticmethod
+    def __emailKey(email_data):
+        # Mails without a Message-ID are keyed by their headers, so refetching one does not
+        # add another row (UNIQUE lets any number of NULLs through)
+        if email_data.get('message_id'):
+            return email_data['message_id']
+        fields = (email_data.get('sender'), email_data.get('date'), email_data.get('subject'))
+        digest = hashlib.sha1("\0".join(str(field or "") for field in fields).encode("utf-8"))
+        return "local:" + digest.hexdigest()
+
+    def __keyAnonymousEmails(self, db):
+        # Rows stored with a NULL message_id before emails got a fallback key
+        for row in db.execute("SELECT id, subject, sender, date FROM emails WHERE message_id IS NULL").fetchall():
+            key = self.__emailKey(dict(row))
+            if db.execute("SELECT 1 FROM emails WHERE message_id = ?", (key,)).fetchone():
+                db.execute("DELETE FROM emails WHERE id = ?", (row['id'],))
+            else:
+                db.execute("UPDATE emails SET message_id = ? WHERE id = ?", (key, row['id']))
+
+    def add_email(self, email_data, mailbox=None, uid=None):
+        """Store a fetched email (the dict built by fetch_preview / stream_email)"""
+        try:
+            sentAt = parsedate_to_datetime(email_data.get('date')).timestamp()
+        except (TypeError, ValueError):
+            sentAt = None
+        with self.__connect() as db:
+            db.execute(
+                "INSERT INTO emails (message_id, mailbox, uid, subject, sender, date, sent_at, body, archived) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (message_id) DO UPDATE SET body = excluded.body "
+                "WHERE length(excluded.body) > length(emails.body)",
+                (self.__emailKey(email_data), mailbox, uid, email_data.get('subject'),
+                 email_data.get('sender'), email_data.get('date'), sentAt,
+                 email_data.get('full_body', email_data.get('body')), time.time()))
+
+    def chat_messages(self, chatName, sender=None, since=None, limit=None):
+        """Archived messages of a chat, oldest first; since is a unix timestamp"""
+        query = ("SELECT m.* FROM messages m JOIN chats c ON c.id = m.chat_id WHERE c.name = ?")
+        params = [chatName]
+        if sender:
+            query += " AND m.sender = ?"
+            params.append(sender)
+        if since:
+            query += " AND m.sent_at >= ?"
+            params.append(since)
+        query += " ORDER BY m.sent_at IS NULL, m.sent_at, m.rowid LIMIT ?"
+        params.append(limit or -1)
+        with self.__connect() as db:
+            return [dict(row) for row in db.execute(query, params)]
+
+    def emails(self, sender=None, since=None, limit=50):
+        """Archived emails, newest first"""
+        query = "SELECT * FROM emails WHERE 1 = 1"
+        params = []
+        if sender:
+            query += " AND sender LIKE ?"
+            params.append("%" + sender + "%")
+        if since:
+            query += " AND sent_at >= ?"
+            params.append(since)
+        query += " ORDER BY sent_at DESC, id DESC LIMIT ?"
+        params.append(limit or -1)
+        with self.__connect() as db:
+            return [dict(row) for row in db.execute(query, params)]
+
+    def search(self, query, limit=SEARCH_RESULTS):
+        """Best matches for query across archived messages and emails, best first"""
+        words = query.split()
+        if not words:
+            return []
+        with self.__connect() as db:
+            if self.fts:
+                # Every word must match, as a prefix; quoting keeps FTS syntax out of user input
+                match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+                hits = db.execute("""
+                    SELECT 'message' AS kind, c.name AS title, m.sender AS sender, m.sent_at AS sent_at,
+                           snippet(messages_fts, 0, '*', '*', '…', 12) AS snippet, messages_fts.rank AS rank
+                    FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid
+                    JOIN chats c ON c.id = m.chat_id
+                    WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?""", (match, limit)).fetchall()
+                hits += db.execute("""
+                    SELECT 'email' AS kind, e.subject AS title, e.sender AS sender, e.sent_at AS sent_at,
+                           snippet(emails_fts, 2, '*', '*', '…', 12) AS snippet, emails_fts.rank AS rank
+                    FROM emails_fts JOIN emails e ON e.id = emails_fts.rowid
+                    WHERE emails_fts MATCH ? ORDER BY rank LIMIT ?""", (match, limit)).fetchall()
+                hits.sort(key=lambda hit: hit['rank'])
+            else:
+                textMatch = " AND ".join(["m.text LIKE ?"] * len(words))
+                emailMatch = " AND ".join(["(e.subject || ' ' || e.body) LIKE ?"] * len(words))
+                patterns = ["%" + word + "%" for word in words]
+                hits = db.execute(
+                    "SELECT 'message' AS kind, c.name AS title, m.sender AS sender, m.sent_at AS sent_at, "
+                    "substr(m.text, 1, 120) AS snippet FROM messages m JOIN chats c ON c.id = m.chat_id "
+                    "WHERE " + textMatch + " ORDER BY m.sent_at DESC LIMIT ?", patterns + [limit]).fetchall()
+                hits += db.execute(
+                    "SELECT 'email' AS kind, e.subject AS title, e.sender AS sender, e.sent_at AS sent_at, "
+                    "substr(e.body, 1, 120) AS snippet FROM emails e "
+                    "WHERE " + emailMatch + " ORDER BY e.sent_at DESC LIMIT ?", patterns + [limit]).fetchall()
+        return [dict(hit) for hit in hits[:limit]]
+
+    def export_chat(self, chatName, path=None):
+        """Write an archived chat to CSV without touching the browser"""
+        path = path or chatName + ".csv"
+        with open(path, 'w', encoding="utf-8", newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS)
+            for m in self.chat_messages(chatName):
+                writer.writerow((m['date'], m['sender'], m['text'], m['replied_to'], m['replied_msg'], m['id']))
+        return path
+
+
+_archive = None
+_archiveLock = threading.Lock()
+
+
+def get_archive():
+    """Process-wide archive shared by the chat export and the IMAP path"""
+    global _archive
+    with _archiveLock:
+        if _archive is None:
+            _archive = MessageArchive(os.getenv('ARCHIVE_PATH', os.path.join(sys.path[0], "archive.db")))
+        return _archive
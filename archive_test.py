@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from archive import MessageArchive
+
+
+def _row(text, msg_id="", sender="Ann", stamp="[10:32, 3/14/2023] Ann: "):
+    return ("10:32", sender, text, "NONE", "NONE", msg_id, stamp)
+
+
+class MessageArchiveTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.archive = MessageArchive(self.path)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_duplicate_messages_are_not_counted(self):
+        rows = [_row("hello", "id1"), _row("lunch?", "id2")]
+        self.assertEqual(self.archive.add_messages("Family", rows), 2)
+        self.assertEqual(self.archive.add_messages("Family", rows + [_row("sure", "id3")]), 1)
+        # Rows without a data-id are keyed by their content
+        self.assertEqual(self.archive.add_messages("Family", [_row("no id")]), 1)
+        self.assertEqual(self.archive.add_messages("Family", [_row("no id")]), 0)
+        self.assertEqual(len(self.archive.chat_messages("Family")), 4)
+
+    def test_refetched_email_keeps_one_row_with_the_longest_body(self):
+        email_data = {'message_id': "<m1@example.com>", 'subject': "Plans", 'sender': "ann@example.com",
+                      'date': "Tue, 14 Mar 2023 10:32:00 +0000", 'body': "short"}
+        self.archive.add_email(email_data)
+        self.archive.add_email(dict(email_data, full_body="short, and the rest of it"))
+        self.archive.add_email(email_data)
+        emails = self.archive.emails()
+        self.assertEqual(len(emails), 1)
+        self.assertEqual(emails[0]['body'], "short, and the rest of it")
+
+    def test_email_without_message_id_is_not_duplicated(self):
+        email_data = {'subject': "No id", 'sender': "bob@example.com", 'date': None, 'body': "text"}
+        self.archive.add_email(email_data)
+        self.archive.add_email(email_data)
+        self.assertEqual(len(self.archive.emails()), 1)
+
+    def test_search_ranks_and_marks_matches(self):
+        if not self.archive.fts:
+            self.skipTest("SQLite built without FTS5")
+        self.archive.add_messages("Work", [
+            _row("the quarterly report mentions the budget once among many other unrelated words", "id1"),
+            _row("budget budget budget", "id2"),
+            _row("nothing to see", "id3"),
+        ])
+        self.archive.add_email({'message_id': "<m1@example.com>", 'subject': "Budget",
+                                'sender': "cfo@example.com", 'date': None, 'body': "The budget is final"})
+        hits = self.archive.search("budg")
+        self.assertEqual(len(hits), 3)
+        ranks = [hit['rank'] for hit in hits]
+        self.assertEqual(ranks, sorted(ranks))
+        messages = [hit for hit in hits if hit['kind'] == 'message']
+        self.assertEqual(messages[0]['snippet'], "*budget* *budget* *budget*")
+        self.assertEqual(messages[0]['title'], "Work")
+        email = next(hit for hit in hits if hit['kind'] == 'email')
+        self.assertEqual(email['snippet'], "The *budget* is final")
+
+    def test_search_needs_every_word_and_ignores_fts_syntax(self):
+        self.archive.add_messages("Work", [_row("budget meeting", "id1"), _row("budget only", "id2")])
+        self.assertEqual(len(self.archive.search("budget meeting")), 1)
+        self.assertEqual(self.archive.search('meeting" OR "only'), [])
+        self.assertEqual(self.archive.search("   "), [])
+
+    def test_search_without_fts_falls_back_to_like(self):
+        self.archive.add_messages("Work", [_row("budget meeting", "id1"), _row("other", "id2")])
+        self.archive.fts = False
+        hits = self.archive.search("meeting budget")
+        self.assertEqual([hit['snippet'] for hit in hits], ["budget meeting"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Import-time benchmark: fails if importing the bot modules gets slow or loads heavy dependencies again.
+
+Usage: python bench_imports.py [module ...]
+"""
+import os
+import subprocess
+import sys
+
+
+MODULES = ("whatsappEmail", "Whatsapp", "email_automation", "archive", "imap_pool", "summarizer")
+# Only needed once a browser starts or a model is called
+HEAVY = ("selenium.webdriver", "openai", "tiktoken")
+BUDGET = float(os.getenv("IMPORT_BUDGET", "0.5"))
+RUNS = 5
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started, ",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def measure(module):
+    """Best of RUNS fresh-interpreter imports, and the heavy modules it loaded"""
+    best = None
+    heavy = ""
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.splitlines()[-1].split(" ", 1)
+        seconds, heavy = float(output[0]), output[1].strip()
+        best = seconds if best is None else min(best, seconds)
+    return best, heavy
+
+
+def main(modules):
+    failed = False
+    for module in modules:
+        seconds, heavy = measure(module)
+        ok = seconds <= BUDGET and not heavy
+        failed = failed or not ok
+        print("{:<20} {:7.3f}s  {}{}".format(
+            module, seconds, "ok" if ok else "FAIL", "  (loaded {})".format(heavy) if heavy else ""))
+    print("Budget: {:.2f}s per module".format(BUDGET))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or MODULES))
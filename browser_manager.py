@@ -0,0 +1,221 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium.common.exceptions import WebDriverException
+
+from chrome_profile import profile_for
+
+
+# Seconds between liveness pings of the shared browser
+HEALTH_CHECK_INTERVAL = 30
+
+TAB_URLS = {
+    'whatsapp': 'https://web.whatsapp.com',
+    'email': 'https://mail.google.com/',
+}
+
+
+def chrome_options(profile, silent=False, headless=False):
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if silent:
+        options.add_argument("--log-level=3")
+    if headless:
+        options.add_argument("--headless")
+        options.add_argument("--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--no-sandbox")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    options.add_experimental_option("useAutomationExtension", False)
+    for argument in profile.chrome_arguments():
+        options.add_argument(argument)
+    return options
+
+
+class BrowserManager:
+    """One warm Chrome shared by the WhatsApp bot and the Gmail automation, one named tab per use.
+
+    Tabs are switched under a lock, and a browser that died is relaunched with
+    its tabs reopened.
+    """
+
+    def __init__(self, profile, executable_path=None, silent=False, headless=False):
+        self.profile = profile
+        self.executable_path = executable_path
+        self.silent = silent
+        self.headless = headless
+        self.lock = threading.RLock()
+
+        self.__driver = None
+        self.__tabs = {}  # name -> (window handle, url)
+        self.__current = None
+        self.__checkedAt = 0
+
+    def __launch(self):
+        # Imported here: selenium.webdriver is slow to import and only needed once Chrome starts
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+
+        started = time.time()
+        self.profile.prepare()
+        options = chrome_options(self.profile, self.silent, self.headless)
+        if self.executable_path:
+            self.__driver = webdriver.Chrome(service=Service(self.executable_path), options=options)
+        else:
+            self.__driver = webdriver.Chrome(options=options)
+        self.__current = self.__driver.current_window_handle
+        self.__checkedAt = time.time()
+        print("[Browser] Chrome started with profile {} in {:.1f}s".format(
+            self.profile.path, self.__checkedAt - started))
+
+    def __isAlive(self):
+        try:
+            self.__driver.execute_script("return 1")
+            return True
+        except WebDriverException:
+            return False
+
+    def __ensure(self):
+        if self.__driver is None:
+            self.__launch()
+        elif time.time() - self.__checkedAt >= HEALTH_CHECK_INTERVAL:
+            if self.__isAlive():
+                self.__checkedAt = time.time()
+            else:
+                print("[Browser] Chrome stopped responding, restarting")
+                self.restart()
+        return self.__driver
+
+    def restart(self):
+        with self.lock:
+            tabs = {name: url for name, (handle, url) in self.__tabs.items()}
+            self.quit()
+            self.__launch()
+            for name, url in tabs.items():
+                self.__open(name, url)
+
+    def __open(self, name, url):
+        driver = self.__driver
+        # The first tab reuses the window Chrome starts with
+        if self.__tabs or driver.current_url not in ("about:blank", "data:,"):
+            driver.switch_to.new_window('tab')
+        handle = driver.current_window_handle
+        self.__tabs[name] = (handle, url)
+        self.__current = handle
+        if url:
+            driver.get(url)
+        return handle
+
+    def activate(self, name, url=None):
+        """Switch to the named tab (opening it first if needed) and return the driver"""
+        with self.lock:
+            driver = self.__ensure()
+            entry = self.__tabs.get(name)
+            if entry is None:
+                self.__open(name, url or TAB_URLS.get(name))
+            elif self.__current != entry[0]:
+                try:
+                    driver.switch_to.window(entry[0])
+                except WebDriverException:
+                    # Tab was closed by hand
+                    del self.__tabs[name]
+                    return self.activate(name, url)
+                self.__current = entry[0]
+            return driver
+
+    @contextmanager
+    def tab(self, name, url=None):
+        """Hold the browser on the named tab for a block of work"""
+        with self.lock:
+            yield self.activate(name, url)
+
+    def has_tab(self, name):
+        return name in self.__tabs
+
+    def tab_driver(self, name, url=None):
+        return TabDriver(self, name, url)
+
+    def close_tab(self, name):
+        """Close the named tab; closing the last one shuts Chrome down"""
+        with self.lock:
+            entry = self.__tabs.pop(name, None)
+            if entry and self.__driver is not None:
+                if not self.__tabs:
+                    self.quit()
+                    return
+                self.__driver.switch_to.window(entry[0])
+                self.__driver.close()
+                other = next(iter(self.__tabs.values()))[0]
+                self.__driver.switch_to.window(other)
+                self.__current = other
+
+    def quit(self):
+        with self.lock:
+            if self.__driver is not None:
+                try:
+                    self.__driver.quit()
+                except WebDriverException:
+                    pass
+            self.__driver = None
+            self.__tabs = {}
+            self.__current = None
+
+
+class TabDriver:
+    """WebDriver stand-in bound to one tab: every call makes that tab current and holds the
+    browser lock until the WebDriver command has finished"""
+
+    def __init__(self, manager, name, url=None):
+        self.manager = manager
+        self.name = name
+        self.url = url
+
+    def claim(self):
+        """Keep this tab current (and other users out) for a block of calls"""
+        return self.manager.tab(self.name, self.url)
+
+    def quit(self):
+        """Close this tab only; the shared Chrome stays up for the other tabs"""
+        self.manager.close_tab(self.name)
+
+    close = quit
+
+    def __getattr__(self, attr):
+        # Properties such as title or current_url run their command right here
+        with self.manager.tab(self.name, self.url) as driver:
+            value = getattr(driver, attr)
+        if not callable(value):
+            return value
+
+        def locked(*args, **kwargs):
+            with self.manager.tab(self.name, self.url) as driver:
+                return getattr(driver, attr)(*args, **kwargs)
+        return locked
+
+
+_managers = {}
+_managersLock = threading.Lock()
+
+
+def get_browser(role="main", executable_path=None, silent=None, headless=None):
+    """Process-wide browser for a role; options left as None accept whatever it runs with.
+
+    Chrome cannot open one profile twice, so asking for a role's browser with other launch
+    options than it was created with raises ValueError; use another role for those.
+    """
+    with _managersLock:
+        manager = _managers.get(role)
+        if manager is None:
+            manager = _managers[role] = BrowserManager(
+                profile_for(role), executable_path, bool(silent), bool(headless))
+        elif ((executable_path is not None and executable_path != manager.executable_path)
+              or (silent is not None and silent != manager.silent)
+              or (headless is not None and headless != manager.headless)):
+            raise ValueError(
+                "Browser for role '{}' already runs with executable_path={!r}, silent={}, headless={}; "
+                "pass a different role for other options".format(
+                    role, manager.executable_path, manager.silent, manager.headless))
+        return manager
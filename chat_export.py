@@ -0,0 +1,78 @@
+import csv
+import os
+import time
+
+
+COLUMNS = ("Date", "Sender", "Message", "Replied To", "Replied Message", "Message ID")
+FLUSH_ROWS = 200
+FLUSH_SECONDS = 5.0
+
+
+class ChatExporter:
+    """Appends message rows to a chat's CSV as they are extracted, skipping messages already in it"""
+
+    def __init__(self, path, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.written = 0
+
+        self.__seen = set()
+        self.__pending = 0
+        self.__flushedAt = time.time()
+
+        columns = None
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, encoding="utf-8", newline='') as file:
+                reader = csv.reader(file)
+                columns = tuple(next(reader, ()))
+                # Exports made before message ids were recorded are keyed by their content
+                self.__hasIds = "Message ID" in columns
+                for row in reader:
+                    self.__seen.add(self.__key(row))
+        else:
+            self.__hasIds = True
+
+        self.__file = open(path, 'a', encoding="utf-8", newline='')
+        self.__writer = csv.writer(self.__file)
+        if columns is None:
+            self.__writer.writerow(COLUMNS)
+
+    def __key(self, row):
+        if self.__hasIds and len(row) > 5 and row[5]:
+            return row[5]
+        return tuple(row[:5])
+
+    def write(self, rows):
+        """Write the rows not exported yet; returns how many were new"""
+        new = 0
+        for row in rows:
+            row = list(row)
+            key = self.__key(row)
+            if key in self.__seen:
+                continue
+            self.__seen.add(key)
+            self.__writer.writerow(row[:6] if self.__hasIds else row[:5])
+            new += 1
+
+        self.written += new
+        self.__pending += new
+        if self.__pending >= self.flush_rows or time.time() - self.__flushedAt >= self.flush_seconds:
+            self.flush()
+        return new
+
+    def flush(self):
+        self.__file.flush()
+        self.__pending = 0
+        self.__flushedAt = time.time()
+
+    def close(self):
+        if not self.__file.closed:
+            self.flush()
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
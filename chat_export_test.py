@@ -0,0 +1,68 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from chat_export import COLUMNS, ChatExporter
+
+
+ROWS = [
+    ("10:32", "Ann", "hello", "NONE", "NONE", "id1", "[10:32, 3/14/2023] Ann: "),
+    ("10:33", "Bob", 'lunch, "maybe"\nat noon', "Ann", "hello", "id2", "[10:33, 3/14/2023] Bob: "),
+]
+
+
+def _read(path):
+    with open(path, encoding="utf-8", newline='') as file:
+        return list(csv.reader(file))
+
+
+class ChatExporterTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        os.close(handle)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_rows_are_written_under_the_header(self):
+        with ChatExporter(self.path) as exporter:
+            self.assertEqual(exporter.write(ROWS), 2)
+        self.assertEqual(_read(self.path), [list(COLUMNS)] + [list(row[:6]) for row in ROWS])
+
+    def test_reopening_appends_only_new_messages(self):
+        with ChatExporter(self.path) as exporter:
+            exporter.write(ROWS[:1])
+        with ChatExporter(self.path) as exporter:
+            self.assertEqual(exporter.write(ROWS), 1)
+            self.assertEqual(exporter.write(ROWS), 0)
+        lines = _read(self.path)
+        self.assertEqual(lines[0], list(COLUMNS))
+        self.assertEqual([line[5] for line in lines[1:]], ["id1", "id2"])
+
+    def test_export_without_message_ids_keeps_its_columns(self):
+        with open(self.path, 'w', encoding="utf-8", newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS[:5])
+            writer.writerow(ROWS[0][:5])
+        with ChatExporter(self.path) as exporter:
+            # Keyed by content: the same message under a new data-id is still a duplicate
+            self.assertEqual(exporter.write([ROWS[0][:5] + ("new-id",), ROWS[1]]), 1)
+        self.assertEqual(_read(self.path)[1:], [list(ROWS[0][:5]), list(ROWS[1][:5])])
+
+    def test_rows_are_flushed_in_batches(self):
+        exporter = ChatExporter(self.path, flush_rows=2, flush_seconds=3600)
+        try:
+            exporter.write(ROWS[:1])
+            # Header and first row still buffered
+            self.assertEqual(_read(self.path), [])
+            exporter.write(ROWS[1:])
+            self.assertEqual(len(_read(self.path)), 3)
+        finally:
+            exporter.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import shutil
+import socket
+import sys
+import time
+
+
+# Cache directories above this many bytes are cleared before Chrome starts
+CACHE_LIMIT = 200 * 1024 * 1024
+DISK_CACHE_SIZE = 50 * 1024 * 1024
+
+# What a logged-in session needs: cookies (Gmail) plus local storage and IndexedDB (WhatsApp Web)
+SESSION_ENTRIES = (
+    "Local State",
+    os.path.join("Default", "Preferences"),
+    os.path.join("Default", "Cookies"),
+    os.path.join("Default", "Network"),
+    os.path.join("Default", "Local Storage"),
+    os.path.join("Default", "Session Storage"),
+    os.path.join("Default", "IndexedDB"),
+)
+
+# Rebuilt by Chrome on demand, safe to delete between runs
+CACHE_ENTRIES = (
+    os.path.join("Default", "Cache"),
+    os.path.join("Default", "Code Cache"),
+    os.path.join("Default", "GPUCache"),
+    os.path.join("Default", "DawnCache"),
+    os.path.join("Default", "Media Cache"),
+    os.path.join("Default", "Service Worker", "CacheStorage"),
+    os.path.join("Default", "Service Worker", "ScriptCache"),
+    "GrShaderCache",
+    "GraphiteDawnCache",
+    "ShaderCache",
+    "component_crx_cache",
+    "optimization_guide_model_store",
+    "Crashpad",
+)
+
+# Background features a bot profile never needs
+SLIM_ARGUMENTS = (
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-extensions",
+    "--disable-sync",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-features=Translate,OptimizationHints,MediaRouter",
+    "--disk-cache-size={}".format(DISK_CACHE_SIZE),
+)
+
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _copy(source, target):
+    if os.path.isdir(source):
+        shutil.copytree(source, target, dirs_exist_ok=True)
+    elif os.path.exists(source):
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        shutil.copy2(source, target)
+
+
+class ChromeProfile:
+    """Dedicated minimal Chrome user-data-dir for one role, with login snapshots and cache trimming"""
+
+    def __init__(self, path, snapshot_path=None, cache_limit=CACHE_LIMIT):
+        self.path = path
+        self.snapshot_path = snapshot_path or path + ".snapshot"
+        self.cache_limit = cache_limit
+
+    def prepare(self):
+        """Get the profile ready for launch and return its path"""
+        if not os.path.isdir(os.path.join(self.path, "Default")) and os.path.isdir(self.snapshot_path):
+            self.restore()
+        os.makedirs(self.path, exist_ok=True)
+        self.__clearStaleLock()
+        if self.cache_size() > self.cache_limit:
+            self.trim_caches()
+        return self.path
+
+    def chrome_arguments(self):
+        return ["user-data-dir={}".format(self.path)] + list(SLIM_ARGUMENTS)
+
+    def __clearStaleLock(self):
+        # Chrome's lock is a "<host>-<pid>" symlink; left behind when Chrome was killed
+        lock = os.path.join(self.path, "SingletonLock")
+        try:
+            host, pid = os.readlink(lock).rsplit("-", 1)
+        except (OSError, ValueError):
+            return
+        if host == socket.gethostname():
+            try:
+                os.kill(int(pid), 0)
+                print("[Profile] {} is in use by Chrome process {}".format(self.path, pid))
+                return
+            except (OSError, ValueError):
+                pass
+        for name in ("SingletonLock", "SingletonCookie", "SingletonSocket"):
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    def cache_size(self):
+        return sum(_size(os.path.join(self.path, entry)) for entry in CACHE_ENTRIES
+                   if os.path.exists(os.path.join(self.path, entry)))
+
+    def trim_caches(self):
+        freed = 0
+        for entry in CACHE_ENTRIES:
+            target = os.path.join(self.path, entry)
+            if not os.path.exists(target):
+                continue
+            freed += _size(target)
+            if os.path.isdir(target):
+                shutil.rmtree(target, ignore_errors=True)
+            else:
+                os.remove(target)
+        print("[Profile] Trimmed {:.1f} MB of caches from {}".format(freed / 1024 / 1024, self.path))
+
+    def snapshot(self):
+        """Save the session state (not caches) so a lost profile can be restored without logging in"""
+        staging = self.snapshot_path + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        started = time.time()
+        try:
+            for entry in SESSION_ENTRIES:
+                _copy(os.path.join(self.path, entry), os.path.join(staging, entry))
+        except (OSError, shutil.Error) as e:
+            print("[Profile] Snapshot failed: {}".format(e))
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        shutil.rmtree(self.snapshot_path, ignore_errors=True)
+        os.replace(staging, self.snapshot_path)
+        print("[Profile] Snapshot of {} saved ({:.1f} MB, {:.2f}s)".format(
+            self.path, _size(self.snapshot_path) / 1024 / 1024, time.time() - started))
+        return True
+
+    def restore(self):
+        """Rebuild the profile from the last snapshot"""
+        if not os.path.isdir(self.snapshot_path):
+            return False
+        started = time.time()
+        for entry in SESSION_ENTRIES:
+            _copy(os.path.join(self.snapshot_path, entry), os.path.join(self.path, entry))
+        print("[Profile] Restored {} from snapshot in {:.2f}s".format(self.path, time.time() - started))
+        return True
+
+
+def profile_for(role):
+    """Profile of a role; the default role keeps the existing UserData folder and its login"""
+    root = os.getenv('CHROME_PROFILE_ROOT', sys.path[0])
+    name = "UserData" if role == "main" else "UserData-" + role
+    return ChromeProfile(os.path.join(root, name))
@@ -0,0 +1,85 @@
+import asyncio
+import inspect
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+COMMAND_WORKERS = int(os.getenv('COMMAND_WORKERS', '4'))
+# Commands allowed to wait for a free worker before new ones are turned away
+COMMAND_BACKLOG = int(os.getenv('COMMAND_BACKLOG', '16'))
+
+
+class CommandExecutor:
+    """Runs chat command handlers on a bounded thread pool so the hook loop keeps reading messages.
+
+    Handlers may be plain functions or coroutine functions (run on the worker's own event loop).
+    Commands submitted with the same key (a chat) run one after another, in order.
+    They must not drive the browser; replies go through an Outbox, which the browser thread drains.
+    """
+
+    def __init__(self, workers=COMMAND_WORKERS, backlog=COMMAND_BACKLOG, on_error=None):
+        self.workers = workers
+        self.on_error = on_error    # on_error(error) when a handler raises
+
+        self.__pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command")
+        self.__slots = threading.BoundedSemaphore(workers + backlog)
+        self.__lock = threading.Lock()
+        self.__waiting = {}  # key -> commands queued behind the one running for that key
+
+    def __call(self, func, args, future):
+        try:
+            result = func(*args)
+            if inspect.isawaitable(result):
+                result = asyncio.run(result)
+            future.set_result(result)
+        except Exception as e:
+            print(f"[Command] {getattr(func, '__name__', func)} failed: {e}")
+            future.set_result(None)
+            if self.on_error:
+                try:
+                    self.on_error(e)
+                except Exception as callbackError:
+                    print(f"[Command] Error callback failed: {callbackError}")
+        finally:
+            self.__slots.release()
+
+    def __run(self, func, args, key, future):
+        # A key's later commands run on this same worker once the current one is done
+        while True:
+            self.__call(func, args, future)
+            if key is None:
+                return
+            with self.__lock:
+                waiting = self.__waiting[key]
+                if not waiting:
+                    del self.__waiting[key]
+                    return
+                func, args, future = waiting.popleft()
+
+    def submit(self, func, *args, key=None):
+        """Queue func(*args); returns a Future for its result, or None when the backlog is full"""
+        if not self.__slots.acquire(blocking=False):
+            return None
+        future = Future()
+        if key is not None:
+            with self.__lock:
+                if key in self.__waiting:
+                    self.__waiting[key].append((func, args, future))
+                    return future
+                self.__waiting[key] = deque()
+        try:
+            self.__pool.submit(self.__run, func, args, key, future)
+        except RuntimeError:
+            # Already shut down
+            self.__slots.release()
+            if key is not None:
+                with self.__lock:
+                    del self.__waiting[key]
+            return None
+        return future
+
+    def shutdown(self, wait=True):
+        """Stop taking commands; with wait, let the running and queued ones finish"""
+        self.__pool.shutdown(wait=wait)
@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+
+from command_executor import CommandExecutor
+
+
+class CommandExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = CommandExecutor(workers=4, backlog=16)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_commands_with_a_key_run_in_order_one_at_a_time(self):
+        ran = []
+        active = []
+        peak = []
+
+        def command(i):
+            active.append(i)
+            peak.append(len(active))
+            time.sleep(0.01)
+            ran.append(i)
+            active.remove(i)
+
+        futures = [self.executor.submit(command, i, key="Ann") for i in range(8)]
+        for future in futures:
+            future.result(5)
+        self.assertEqual(ran, list(range(8)))
+        self.assertEqual(max(peak), 1)
+
+    def test_different_keys_run_in_parallel(self):
+        # Each command waits for the other; run one after another they would time out
+        barrier = threading.Barrier(2, timeout=5)
+        futures = [self.executor.submit(barrier.wait, key=key) for key in ("Ann", "Bob")]
+        self.assertEqual(sorted(future.result(5) for future in futures), [0, 1])
+
+    def test_shutdown_drains_queued_commands(self):
+        ran = []
+        for i in range(5):
+            self.executor.submit(lambda i=i: time.sleep(0.02) or ran.append(i), key="Ann")
+        self.executor.submit(lambda: ran.append("other"), key="Bob")
+        self.executor.shutdown(wait=True)
+        self.assertEqual([i for i in ran if i != "other"], list(range(5)))
+        self.assertIn("other", ran)
+        self.assertIsNone(self.executor.submit(lambda: None))
+
+    def test_full_backlog_turns_commands_away(self):
+        executor = CommandExecutor(workers=1, backlog=1)
+        release = threading.Event()
+        try:
+            self.assertIsNotNone(executor.submit(release.wait, 5))
+            self.assertIsNotNone(executor.submit(release.wait, 5))
+            self.assertIsNone(executor.submit(release.wait, 5))
+        finally:
+            release.set()
+            executor.shutdown()
+        # Slots come back once commands finish
+        self.assertIsNotNone(self.executor.submit(lambda: None))
+
+    def test_coroutine_handlers_and_errors(self):
+        errors = []
+        executor = CommandExecutor(workers=1, on_error=errors.append)
+
+        async def answer():
+            return 42
+
+        def fail():
+            raise ValueError("bad command")
+
+        try:
+            self.assertEqual(executor.submit(answer).result(5), 42)
+            self.assertIsNone(executor.submit(fail).result(5))
+            self.assertEqual([str(e) for e in errors], ["bad command"])
+        finally:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
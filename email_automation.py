@@ -1,13 +1,18 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from openai import OpenAI
 from dotenv import load_dotenv
-import time
 import os
-import platform
+
+from browser_manager import get_browser
+from llm_cache import get_summary_cache
+from llm_async import get_llm
+from summarizer import (BATCH_TEMPLATE, CHUNK_TOKENS, estimate_tokens, map_reduce_summarize,
+                        pack_batches, summarize_batch)
+from lazy_import import lazy
+from waits import all_of, dom_stable, element_present, timings, wait_for
+
+# selenium.webdriver pulls in every browser driver; loaded on first use
+By = lazy("selenium.webdriver.common.by", "By")
+WebDriverWait = lazy("selenium.webdriver.support.ui", "WebDriverWait")
+EC = lazy("selenium.webdriver.support.expected_conditions")
 
 # Load environment variables
 load_dotenv()
@@ -15,41 +20,98 @@ CLIENT_EMAIL = os.getenv("CLIENT_EMAIL")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-if not all([CLIENT_EMAIL, EMAIL_PASSWORD, OPENAI_API_KEY]):
-    raise ValueError("Missing one or more required environment variables: CLIENT_EMAIL, EMAIL_PASSWORD, OPENAI_API_KEY")
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+def require_env():
+    """Checked when the Gmail automation is used, not at import, so other commands start without it"""
+    if not all([CLIENT_EMAIL, EMAIL_PASSWORD, OPENAI_API_KEY]):
+        raise ValueError("Missing one or more required environment variables: CLIENT_EMAIL, EMAIL_PASSWORD, OPENAI_API_KEY")
+
+
+GMAIL_URL = "https://mail.google.com/"
+SUMMARY_MODEL = "gpt-4"
+SUMMARY_TEMPLATE = "Summarize this email:\n{content}"
+
+
+async def _summarize(content):
+    if estimate_tokens(content) > CHUNK_TOKENS:
+        # Too long for one prompt: summarize chunks in parallel and merge them
+        return await map_reduce_summarize(get_llm(), SUMMARY_MODEL, content)
+    return await get_llm().complete(
+        [{"role": "user", "content": SUMMARY_TEMPLATE.format(content=content)}], SUMMARY_MODEL)
+
 
+async def summarize_email_async(content):
+    """Summarize one email, reusing the cached summary when the same mail was seen before"""
+    return await get_summary_cache().cached_async(
+        SUMMARY_MODEL, SUMMARY_TEMPLATE, content, lambda: _summarize(content))
 
-def get_chrome_profile_path():
-    system = platform.system()
-    if system == "Windows":
-        base_path = os.path.join(os.environ["USERPROFILE"], "AppData", "Local", "Google", "Chrome", "User Data")
-    elif system == "Darwin":
-        base_path = os.path.expanduser("~/Library/Application Support/Google/Chrome")
-    elif system == "Linux":
-        base_path = os.path.expanduser("~/.config/google-chrome")
-    else:
-        raise Exception("Unsupported OS")
-    return base_path, "Default"
+
+def summarize_email(content):
+    return get_llm().run(summarize_email_async(content))
+
+
+def summarize_emails(contents):
+    """Summarize several emails with as few requests as the token budget allows"""
+    cache = get_summary_cache()
+    summaries = [None] * len(contents)
+    pending = []
+    for i, content in enumerate(contents):
+        # One lookup per email for the hit/miss counters, whichever template it was cached under
+        summaries[i] = cache.get_first([cache.key(SUMMARY_MODEL, BATCH_TEMPLATE, content),
+                                        cache.key(SUMMARY_MODEL, SUMMARY_TEMPLATE, content)])
+        if summaries[i] is None:
+            pending.append((i, content))
+
+    async def summarize_one(content):
+        # Already looked up above: compute and store without counting another miss
+        summary = await _summarize(content)
+        if summary:
+            cache.set(cache.key(SUMMARY_MODEL, SUMMARY_TEMPLATE, content), summary)
+        return summary
+
+    # Batches are sent concurrently, bounded by the LLM executor's semaphore
+    batches = pack_batches(pending)
+    llm = get_llm()
+    results = llm.gather(*(
+        summarize_batch(llm, SUMMARY_MODEL, [c for _, c in batch], summarize_one)
+        for batch in batches))
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            print(f"[Email] Error summarizing emails: {result}")
+            continue
+        for (i, content), summary in zip(batch, result):
+            summaries[i] = summary
+            if summary and len(batch) > 1:
+                cache.set(cache.key(SUMMARY_MODEL, BATCH_TEMPLATE, content), summary)
+    return summaries
 
 
 def create_driver():
-    user_data_dir, profile_dir = get_chrome_profile_path()
-    chrome_options = Options()
-    chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
-    chrome_options.add_argument(f"--profile-directory={profile_dir}")
-    chrome_options.add_argument("--start-maximized")
-    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    chrome_options.add_experimental_option("useAutomationExtension", False)
-    return webdriver.Chrome(options=chrome_options)
+    """The Gmail tab of the shared warm browser"""
+    return get_browser().tab_driver("email", GMAIL_URL)
 
 
 def get_new_email_summaries():
-    driver = create_driver()
+    require_env()
     try:
-        driver.get("https://mail.google.com/")
+        contents = read_unread_emails()
+
+        # One request for all unread emails instead of one per email
+        summaries = [s for s in summarize_emails(contents) if s]
+        stats = get_summary_cache().stats()
+        print(f"[Email] Summary cache: {stats['memory_hits'] + stats['disk_hits']} hits, {stats['misses']} misses")
+        return "\n\n".join(summaries) if summaries else "No summaries generated."
+
+    except Exception as e:
+        print(f"[Email] General error: {e}")
+        return "Failed to get email summaries."
+
+
+def read_unread_emails(limit=3):
+    """Text of the newest unread Gmail messages, read in the shared browser's Gmail tab"""
+    # The tab is held only while reading, summarizing happens after it is released
+    with get_browser().tab("email", GMAIL_URL) as driver:
+        driver.get(GMAIL_URL)
         wait = WebDriverWait(driver, 20)
 
         try:
@@ -78,66 +140,57 @@ def get_new_email_summaries():
 
         wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".zA.zE")))
         unread_emails = driver.find_elements(By.CSS_SELECTOR, ".zA.zE")
-        summaries = []
+        contents = []
 
-        for email in unread_emails[:3]:
+        for email in unread_emails[:limit]:
             try:
                 email.click()
-                time.sleep(2)
 
-                content_element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div.a3s")))
+                content_element = wait_for(driver, element_present(By.CSS_SELECTOR, "div.a3s"),
+                                           timeout=20, stage="gmail.open_email")
                 full_content = content_element.text.strip()
 
                 if full_content:
-                    response = openai_client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[{"role": "user", "content": f"Summarize this email:\n{full_content}"}]
-                    )
-                    summary = response.choices[0].message.content
-                    summaries.append(summary)
+                    contents.append(full_content)
 
                 driver.back()
-                time.sleep(2)
+                wait_for(driver, all_of(element_present(By.CSS_SELECTOR, ".zA"), dom_stable(300)),
+                         timeout=20, stage="gmail.back_to_inbox", required=False)
             except Exception as e:
-                print(f"[Email] Error summarizing email: {e}")
+                print(f"[Email] Error reading email: {e}")
                 continue
 
-        return "\n\n".join(summaries) if summaries else "No summaries generated."
-
-    except Exception as e:
-        print(f"[Email] General error: {e}")
-        return "Failed to get email summaries."
-    finally:
-        driver.quit()
+        timings.report()
+        return contents
 
 
 def compose_email(recipient, subject, body):
-    driver = create_driver()
-    try:
-        driver.get("https://mail.google.com/")
-        input("[Email] Login if needed, then press Enter to continue...")
+    require_env()
+    # Held for the whole compose so no other command switches tabs under it
+    with get_browser().tab("email", GMAIL_URL) as driver:
+        try:
+            driver.get(GMAIL_URL)
+            input("[Email] Login if needed, then press Enter to continue...")
 
-        compose_button = WebDriverWait(driver, 20).until(
-            EC.element_to_be_clickable((By.XPATH, '//div[text()="Compose"]'))
-        )
-        compose_button.click()
+            compose_button = WebDriverWait(driver, 20).until(
+                EC.element_to_be_clickable((By.XPATH, '//div[text()="Compose"]'))
+            )
+            compose_button.click()
 
-        to_input = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.NAME, "to")))
-        subject_input = driver.find_element(By.NAME, "subjectbox")
-        body_input = driver.find_element(By.CSS_SELECTOR, "div[aria-label='Message Body']")
+            to_input = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.NAME, "to")))
+            subject_input = driver.find_element(By.NAME, "subjectbox")
+            body_input = driver.find_element(By.CSS_SELECTOR, "div[aria-label='Message Body']")
 
-        to_input.send_keys(recipient)
-        subject_input.send_keys(subject)
-        body_input.send_keys(body)
+            to_input.send_keys(recipient)
+            subject_input.send_keys(subject)
+            body_input.send_keys(body)
 
-        send_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, '//div[text()="Send"]'))
-        )
-        send_button.click()
+            send_button = WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.XPATH, '//div[text()="Send"]'))
+            )
+            send_button.click()
 
-        print(f"[Email] Sent to {recipient}")
+            print(f"[Email] Sent to {recipient}")
 
-    except Exception as e:
-        print(f"[Email] Failed to send email: {e}")
-    finally:
-        driver.quit()
+        except Exception as e:
+            print(f"[Email] Failed to send email: {e}")
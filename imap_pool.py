@@ -0,0 +1,197 @@
+import imaplib
+import select
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Sessions unused for longer than this get a NOOP before being handed out
+HEALTH_CHECK_INTERVAL = 60
+# RFC 2177: clients should re-issue IDLE at least every 29 minutes
+IDLE_REFRESH = 29 * 60
+
+
+class ImapSessionPool:
+    """Keeps logged-in IMAP sessions (mailbox already selected) alive between requests"""
+
+    def __init__(self, host, port, user, password, mailbox="inbox", size=2, use_ssl=True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.mailbox = mailbox
+        self.size = size
+        self.use_ssl = use_ssl
+
+        self.__idle = []  # (connection, last_used) ready to be handed out
+        self.__slots = threading.BoundedSemaphore(size)
+        self.__lock = threading.Lock()
+
+        self.__pushThread = None
+        self.__pushStop = threading.Event()
+        self.__pushConnection = None
+
+    @classmethod
+    def from_config(cls, config, user, password, **kwargs):
+        """Build a pool from one of WhatsappEmailBot.email_configs entries"""
+        return cls(config['imap_server'], config['imap_port'], user, password,
+                   use_ssl=config.get('imap_ssl', True), **kwargs)
+
+    def __connect(self):
+        if self.use_ssl:
+            mail = imaplib.IMAP4_SSL(self.host, self.port)
+        else:
+            mail = imaplib.IMAP4(self.host, self.port)
+        mail.login(self.user, self.password)
+        mail.select(self.mailbox)
+        return mail
+
+    def __discard(self, mail):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    def __isHealthy(self, mail, lastUsed):
+        if time.monotonic() - lastUsed < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            return mail.noop()[0] == 'OK'
+        except Exception:
+            return False
+
+    def __acquire(self, fresh=False):
+        with self.__lock:
+            while self.__idle and not fresh:
+                mail, lastUsed = self.__idle.pop()
+                if self.__isHealthy(mail, lastUsed):
+                    return mail
+                self.__discard(mail)
+        return self.__connect()
+
+    @contextmanager
+    def session(self, fresh=False):
+        """Borrow a ready session (a new connection with fresh); broken sessions are dropped"""
+        self.__slots.acquire()
+        mail = None
+        try:
+            mail = self.__acquire(fresh)
+            yield mail
+        except (imaplib.IMAP4.abort, OSError):
+            if mail is not None:
+                self.__discard(mail)
+                mail = None
+            raise
+        finally:
+            if mail is not None:
+                with self.__lock:
+                    self.__idle.append((mail, time.monotonic()))
+            self.__slots.release()
+
+    def run(self, func):
+        """Call func(mail) with a ready session and return its result.
+
+        When the server dropped the session, func is retried once on a new connection.
+        """
+        try:
+            with self.session() as mail:
+                return func(mail)
+        except (imaplib.IMAP4.abort, OSError) as e:
+            print(f"[IMAP] Session lost ({e}), retrying on a new connection")
+        with self.session(fresh=True) as mail:
+            return func(mail)
+
+    def close(self):
+        self.stop_idle()
+        with self.__lock:
+            while self.__idle:
+                self.__discard(self.__idle.pop()[0])
+
+    # ===================== IDLE PUSH =====================
+
+    def __responseWaiting(self, mail):
+        # Lines can already sit in imaplib's read buffer (or the SSL layer), where select()
+        # does not see them; peek without blocking to find out
+        sock = mail.socket()
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(mail.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def __idleOnce(self, mail, timeout):
+        """Run one IDLE cycle; returns True if the server announced new mail"""
+        tag = mail._new_tag()
+        mail.send(tag + b" IDLE\r\n")
+        line = mail.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error("IDLE not supported: {}".format(line))
+
+        newMail = False
+        deadline = time.monotonic() + timeout
+        sock = mail.socket()
+        while not self.__pushStop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.__responseWaiting(mail):
+                ready, _, _ = select.select([sock], [], [], min(remaining, 1))
+                if not ready:
+                    continue
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            if line.rstrip().upper().endswith(b"EXISTS"):
+                newMail = True
+                break
+
+        mail.send(b"DONE\r\n")
+        while True:
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            if line.startswith(tag):
+                break
+            if line.rstrip().upper().endswith(b"EXISTS"):
+                newMail = True
+        return newMail
+
+    def __pushLoop(self, callback, timeout):
+        backoff = 1
+        while not self.__pushStop.is_set():
+            try:
+                if self.__pushConnection is None:
+                    self.__pushConnection = self.__connect()
+                    backoff = 1
+                if self.__idleOnce(self.__pushConnection, timeout):
+                    callback()
+            except Exception as e:
+                print(f"[IMAP] IDLE connection lost, reconnecting in {backoff}s: {e}")
+                if self.__pushConnection is not None:
+                    self.__discard(self.__pushConnection)
+                    self.__pushConnection = None
+                self.__pushStop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+        if self.__pushConnection is not None:
+            self.__discard(self.__pushConnection)
+            self.__pushConnection = None
+
+    def start_idle(self, callback, timeout=IDLE_REFRESH):
+        """Watch the mailbox with IDLE on a dedicated connection and call callback() on new mail"""
+        if self.__pushThread and self.__pushThread.is_alive():
+            return
+        self.__pushStop.clear()
+        self.__pushThread = threading.Thread(
+            target=self.__pushLoop, args=(callback, timeout), daemon=True)
+        self.__pushThread.start()
+
+    def stop_idle(self):
+        self.__pushStop.set()
+        if self.__pushThread:
+            self.__pushThread.join(timeout=5)
+            self.__pushThread = None
@@ -0,0 +1,88 @@
+import socket
+import socketserver
+import threading
+import time
+import unittest
+
+from imap_pool import ImapSessionPool
+
+
+class _ImapStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of an IMAP server for the pool: login, select, noop, logout and IDLE"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ImapHandler)
+        self.clients = []
+        self.connections = 0
+
+    def drop_all(self):
+        """Close every client connection, like a server-side timeout"""
+        for client in self.clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.clients = []
+
+
+class _ImapHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.clients.append(self.connection)
+        self.server.connections += 1
+        self.wfile.write(b"* OK IMAP4rev1 stand-in ready\r\n")
+        for line in self.rfile:
+            tag, command = line.split(b" ", 2)[:2]
+            command = command.strip().upper()
+            if command == b"CAPABILITY":
+                self.wfile.write(b"* CAPABILITY IMAP4rev1 IDLE\r\n" + tag + b" OK done\r\n")
+            elif command == b"SELECT":
+                self.wfile.write(b"* 3 EXISTS\r\n* FLAGS ()\r\n" + tag + b" OK [READ-WRITE] done\r\n")
+            elif command == b"IDLE":
+                # New mail announced in the same packet as the continuation
+                self.wfile.write(b"+ idling\r\n* 4 EXISTS\r\n")
+                self.rfile.readline()  # DONE
+                self.wfile.write(tag + b" OK IDLE terminated\r\n")
+            elif command == b"LOGOUT":
+                self.wfile.write(b"* BYE\r\n" + tag + b" OK done\r\n")
+                return
+            else:
+                self.wfile.write(tag + b" OK done\r\n")
+
+
+class ImapSessionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _ImapStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.pool = ImapSessionPool(host, port, "user", "secret", use_ssl=False)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_is_reused(self):
+        for _ in range(3):
+            with self.pool.session() as mail:
+                self.assertEqual(mail.noop()[0], 'OK')
+        self.assertEqual(self.server.connections, 1)
+
+    def test_run_retries_on_a_new_connection_after_a_drop(self):
+        self.assertEqual(self.pool.run(lambda mail: mail.noop()[0]), 'OK')
+        self.server.drop_all()
+        self.assertEqual(self.pool.run(lambda mail: mail.noop()[0]), 'OK')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_idle_reports_exists_sent_with_the_continuation(self):
+        pushed = threading.Event()
+        started = time.monotonic()
+        self.pool.start_idle(pushed.set, timeout=10)
+        self.assertTrue(pushed.wait(5))
+        self.assertLess(time.monotonic() - started, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import importlib
+
+
+class LazyImport:
+    """Module (or module attribute) that is only imported when first used"""
+
+    def __init__(self, module, attr=None):
+        self.__module = module
+        self.__attr = attr
+        self.__target = None
+
+    def __resolve(self):
+        if self.__target is None:
+            target = importlib.import_module(self.__module)
+            self.__target = getattr(target, self.__attr) if self.__attr else target
+        return self.__target
+
+    def __getattr__(self, name):
+        return getattr(self.__resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.__resolve()(*args, **kwargs)
+
+
+def lazy(module, attr=None):
+    return LazyImport(module, attr)
@@ -0,0 +1,84 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '4'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+
+
+class AsyncLLM:
+    """AsyncOpenAI on a private event loop, with bounded parallelism and per-request timeouts"""
+
+    def __init__(self, api_key=None, base_url=None, concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+        self.__client = None
+        self.__semaphore = None
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, daemon=True, name="llm-loop")
+        self.__thread.start()
+
+    @property
+    def client(self):
+        # Built on first use so a missing API key only fails the calls that need it
+        if self.__client is None:
+            # openai takes most of a second to import; only paid when a request is made
+            from openai import AsyncOpenAI
+
+            self.__client = AsyncOpenAI(
+                api_key=self.api_key or os.getenv('OPENAI_API_KEY'),
+                base_url=self.base_url or os.getenv('OPENAI_BASE_URL'))
+        return self.__client
+
+    async def complete(self, messages, model, timeout=None, **kwargs):
+        """Run one chat completion and return the message text"""
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.__semaphore:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model, messages=messages, **kwargs),
+                timeout or self.timeout)
+        return response.choices[0].message.content
+
+    def submit(self, coro):
+        """Schedule a coroutine on the LLM loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.__loop)
+
+    def run(self, coro, timeout=None):
+        """Block until coro finishes on the LLM loop; cancels it if timeout expires"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def gather(self, *coros, timeout=None):
+        """Run several coroutines concurrently; failures are returned as exceptions"""
+        async def gathered():
+            return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(gathered(), timeout)
+
+    def close(self):
+        if self.__client is not None:
+            self.run(self.__client.close())
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join(timeout=5)
+
+
+_llm = None
+_llmLock = threading.Lock()
+
+
+def get_llm():
+    """Process-wide async LLM executor"""
+    global _llm
+    with _llmLock:
+        if _llm is None:
+            _llm = AsyncLLM()
+        return _llm
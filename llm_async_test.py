@@ -0,0 +1,104 @@
+import http.server
+import json
+import threading
+import time
+import unittest
+
+from llm_async import AsyncLLM
+
+
+class _FakeOpenAI(http.server.ThreadingHTTPServer):
+    """Chat completions endpoint that echoes the prompt after a delay, tracking overlap"""
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.3):
+        super().__init__(("127.0.0.1", 0), _CompletionsHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+
+class _CompletionsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = request['messages'][-1]['content']
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(server.delay)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+        if prompt == "fail":
+            # 400 is not retried by the client, so the error reaches the caller at once
+            self.__reply(400, {"error": {"message": "bad prompt", "type": "invalid_request_error"}})
+            return
+        self.__reply(200, {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": request['model'],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "echo: " + prompt}}],
+        })
+
+    def __reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class AsyncLLMTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _FakeOpenAI()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.llm = AsyncLLM(api_key="test", base_url="http://{}:{}/v1".format(host, port), concurrency=4)
+
+    def tearDown(self):
+        self.llm.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __complete(self, prompt):
+        return self.llm.complete([{"role": "user", "content": prompt}], "test-model")
+
+    def test_concurrent_calls_overlap(self):
+        started = time.monotonic()
+        results = self.llm.gather(*(self.__complete(str(i)) for i in range(4)), timeout=10)
+        self.assertEqual(results, ["echo: 0", "echo: 1", "echo: 2", "echo: 3"])
+        self.assertEqual(self.server.peak, 4)
+        # Four sequential requests would take at least 4 x 0.3s
+        self.assertLess(time.monotonic() - started, 4 * self.server.delay)
+
+    def test_concurrency_is_bounded(self):
+        self.llm.concurrency = 2
+        self.llm.gather(*(self.__complete(str(i)) for i in range(4)), timeout=10)
+        self.assertEqual(self.server.peak, 2)
+
+    def test_error_reaches_the_caller(self):
+        from openai import BadRequestError
+
+        with self.assertRaises(BadRequestError):
+            self.llm.run(self.__complete("fail"), timeout=10)
+        # The other calls of a batch still succeed
+        results = self.llm.gather(self.__complete("ok"), self.__complete("fail"), timeout=10)
+        self.assertEqual(results[0], "echo: ok")
+        self.assertIsInstance(results[1], BadRequestError)
+
+    def test_timeout_is_raised(self):
+        with self.assertRaises(TimeoutError):
+            self.llm.run(self.llm.complete([{"role": "user", "content": "slow"}], "test-model",
+                                           timeout=0.05), timeout=10)
+
+
+if __name__ == "__main__":
+    unittest.main()
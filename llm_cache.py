@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+MEMORY_ENTRIES = 256
+DISK_ENTRIES = 5000
+CACHE_TTL = 7 * 24 * 3600
+
+
+class SummaryCache:
+    """Two-tier (in-memory LRU + SQLite) cache of model outputs keyed by their inputs"""
+
+    def __init__(self, path, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES, ttl=CACHE_TTL):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+
+        self.__memory = OrderedDict()  # key -> (value, stored_at)
+        self.__lock = threading.Lock()
+        self.__stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        with self.__connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS llm_cache_access ON llm_cache (last_access)")
+
+    @contextmanager
+    def __connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def key(model, template, content):
+        """Hash of (model, prompt template, whitespace-normalized content)"""
+        normalized = re.sub(r'\s+', ' ', content or "").strip()
+        digest = hashlib.sha256()
+        for part in (model, template, normalized):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def __remember(self, key, value, storedAt):
+        self.__memory[key] = (value, storedAt)
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.memory_entries:
+            self.__memory.popitem(last=False)
+
+    def __lookup(self, key):
+        # Returns (value, stats counter to bump), without bumping it
+        now = time.time()
+        with self.__lock:
+            entry = self.__memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self.__memory.move_to_end(key)
+                return entry[0], 'memory_hits'
+            self.__memory.pop(key, None)
+
+        with self.__connect() as db:
+            row = db.execute("SELECT value, created FROM llm_cache WHERE key = ? AND created > ?",
+                             (key, now - self.ttl)).fetchone()
+            if row:
+                db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+
+        if row:
+            with self.__lock:
+                self.__remember(key, row[0], row[1])
+            return row[0], 'disk_hits'
+        return None, 'misses'
+
+    def get(self, key):
+        return self.get_first([key])
+
+    def get_first(self, keys):
+        """Value of the first key that is cached, counted as a single lookup"""
+        for key in keys:
+            value, counter = self.__lookup(key)
+            if value is not None:
+                break
+        with self.__lock:
+            self.__stats[counter] += 1
+        return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self.__lock:
+            self.__remember(key, value, now)
+        with self.__connect() as db:
+            db.execute("INSERT OR REPLACE INTO llm_cache (key, value, created, last_access) VALUES (?, ?, ?, ?)",
+                       (key, value, now, now))
+            db.execute("DELETE FROM llm_cache WHERE created <= ?", (now - self.ttl,))
+            db.execute("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+                       "ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.disk_entries,))
+
+    def cached(self, model, template, content, compute):
+        """Return the cached output for these inputs, calling compute() on a miss"""
+        key = self.key(model, template, content)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value:
+                self.set(key, value)
+        return value
+
+    async def cached_async(self, model, template, content, compute):
+        """Same as cached() for a coroutine function compute"""
+        key = self.key(model, template, content)
+        value = self.get(key)
+        if value is None:
+            value = await compute()
+            if value:
+                self.set(key, value)
+        return value
+
+    def stats(self):
+        with self.__lock:
+            stats = dict(self.__stats)
+        lookups = sum(stats.values())
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cacheLock = threading.Lock()
+
+
+def get_summary_cache():
+    """Process-wide cache shared by the WhatsApp bot and the Gmail automation"""
+    global _cache
+    with _cacheLock:
+        if _cache is None:
+            _cache = SummaryCache(os.getenv('LLM_CACHE_PATH', os.path.join(sys.path[0], "llm_cache.db")))
+        return _cache
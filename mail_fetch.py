@@ -0,0 +1,198 @@
+import base64
+import binascii
+import email
+import quopri
+import re
+from email.header import decode_header
+
+
+# Enough raw bytes for a 1000 character preview even when base64 encoded UTF-8
+PREVIEW_BYTES = 8192
+
+def _join_response(data):
+    """Flatten imaplib's (prefix, literal) tuples back into one IMAP byte stream"""
+    stream = b""
+    for item in data:
+        if isinstance(item, tuple):
+            stream += item[0] + b"\r\n" + item[1]
+        elif item:
+            stream += item
+    return stream
+
+
+def _tokenize(stream):
+    """Parse an IMAP response into nested lists of str/bytes/None"""
+    stack = [[]]
+    pos = 0
+    while pos < len(stream):
+        char = stream[pos:pos + 1]
+        if char in (b" ", b"\r", b"\n"):
+            pos += 1
+        elif char == b"(":
+            stack.append([])
+            pos += 1
+        elif char == b")":
+            inner = stack.pop()
+            stack[-1].append(inner)
+            pos += 1
+        elif char == b'"':
+            end = pos + 1
+            value = b""
+            while end < len(stream) and stream[end:end + 1] != b'"':
+                if stream[end:end + 1] == b"\\":
+                    end += 1
+                value += stream[end:end + 1]
+                end += 1
+            if end >= len(stream):
+                raise ValueError("unterminated quoted string in IMAP response")
+            stack[-1].append(value.decode("utf-8", "replace"))
+            pos = end + 1
+        elif char == b"{":
+            end = stream.index(b"}", pos)
+            size = int(stream[pos + 1:end])
+            start = stream.index(b"\n", end) + 1
+            if start + size > len(stream):
+                raise ValueError("truncated literal in IMAP response")
+            stack[-1].append(stream[start:start + size])
+            pos = start + size
+        else:
+            end = pos
+            depth = 0
+            # Atoms like BODY[1.2]<0> may contain brackets but not spaces/parens
+            while end < len(stream):
+                c = stream[end:end + 1]
+                if c == b"[":
+                    depth += 1
+                elif c == b"]":
+                    depth -= 1
+                elif depth == 0 and c in (b" ", b"(", b")", b"\r", b"\n"):
+                    break
+                end += 1
+            atom = stream[pos:end].decode("utf-8", "replace")
+            stack[-1].append(None if atom.upper() == "NIL" else atom)
+            pos = end
+    return stack[0]
+
+
+def _fetch_items(items):
+    result = {}
+    for i in range(0, len(items) - 1, 2):
+        # Servers answer BODY.PEEK[1]<0.N> as BODY[1]<0>
+        result[re.sub(r'<\d+>$', '', str(items[i]).upper())] = items[i + 1]
+    return result
+
+
+def parse_fetch(data, uid=None):
+    """Turn the FETCH response for one message into a dict of upper-cased item names.
+
+    imaplib hands back unsolicited FETCHes (flag updates seen during a NOOP, STATUS, ...)
+    along with the answer. With uid only that message's responses are used, merged; without,
+    the response carrying the most items.
+    """
+    responses = [_fetch_items(t) for t in _tokenize(_join_response(data)) if isinstance(t, list)]
+    if uid is not None:
+        result = {}
+        for response in responses:
+            if response.get('UID') == str(uid):
+                result.update(response)
+        return result
+    return max(responses, key=len, default={})
+    return result
+
+
+def find_text_part(structure, section=""):
+    """Return (section, encoding, charset, subtype) of the best text part in a BODYSTRUCTURE"""
+    if not isinstance(structure, list) or len(structure) < 2:
+        return None
+    if isinstance(structure[0], list):
+        # Multipart: children first, then the subtype string and extension data
+        candidates = []
+        for index, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            childSection = "{}.{}".format(section, index + 1) if section else str(index + 1)
+            found = find_text_part(child, childSection)
+            if found:
+                candidates.append(found)
+        plain = [c for c in candidates if c[3] == "plain"]
+        return (plain or candidates or [None])[0]
+
+    mainType = str(structure[0]).lower()
+    subType = str(structure[1]).lower()
+    if mainType != "text" or len(structure) < 6:
+        return None
+    # Skip text parts explicitly sent as attachments
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and str(disposition[0]).lower() == "attachment":
+        return None
+
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = "utf-8"
+    for i in range(0, len(params) - 1, 2):
+        if str(params[i]).lower() == "charset":
+            charset = params[i + 1]
+    encoding = str(structure[5] or "7bit").lower()
+    return (section or "1", encoding, charset, subType)
+
+
+def decode_prefix(raw, encoding, charset):
+    """Decode a possibly truncated transfer-encoded body prefix"""
+    if encoding == "base64":
+        compact = re.sub(rb'\s+', b'', raw)
+        compact = compact[:len(compact) - len(compact) % 4]
+        try:
+            raw = base64.b64decode(compact)
+        except binascii.Error:
+            raw = b""
+    elif encoding == "quoted-printable":
+        # Drop a soft break or escape cut in half by the byte range
+        raw = re.sub(rb'=[0-9A-Fa-f]?$', b'', raw)
+        raw = quopri.decodestring(raw)
+    try:
+        text = raw.decode(charset, "replace")
+    except LookupError:
+        text = raw.decode("utf-8", "replace")
+    # A multi-byte character split by the byte range decodes to U+FFFD
+    return text.rstrip("\ufffd")
+
+
+def _decode_subject(value):
+    if value is None:
+        return ""
+    subject, charset = decode_header(value)[0]
+    if isinstance(subject, bytes):
+        subject = subject.decode(charset or "utf-8", "replace")
+    return subject
+
+
+def fetch_preview(mail, uid, max_bytes=PREVIEW_BYTES):
+    """Fetch headers plus the first max_bytes of the text part without setting \\Seen"""
+    typ, data = mail.uid('fetch', str(uid), '(BODYSTRUCTURE BODY.PEEK[HEADER])')
+    if typ != 'OK' or not data or data[0] is None:
+        return None
+    fetched = parse_fetch(data, uid)
+    if not fetched:
+        return None
+
+    headers = email.message_from_bytes(fetched.get('BODY[HEADER]') or b"")
+    preview = {
+        'subject': _decode_subject(headers["Subject"]),
+        'sender': headers["From"],
+        'date': headers["Date"],
+        'message_id': headers["Message-ID"],
+        'body': "",
+    }
+
+    part = find_text_part(fetched.get('BODYSTRUCTURE') or [])
+    if part:
+        section, encoding, charset, subType = part
+        typ, data = mail.uid('fetch', str(uid), '(BODY.PEEK[{}]<0.{}>)'.format(section, max_bytes))
+        if typ == 'OK' and data and data[0] is not None:
+            raw = parse_fetch(data, uid).get('BODY[{}]'.format(section)) or b""
+            if isinstance(raw, str):
+                raw = raw.encode()
+            body = decode_prefix(raw, encoding, charset)
+            if subType == "html":
+                body = re.sub(r'\s+', ' ', re.sub(r'<[^>]*>', ' ', body)).strip()
+            preview['body'] = body
+    return preview
@@ -0,0 +1,100 @@
+import unittest
+
+from mail_fetch import decode_prefix, fetch_preview, find_text_part, parse_fetch
+
+
+# What imaplib returns for: UID FETCH 7 (BODYSTRUCTURE BODY.PEEK[HEADER])
+HEADER = b'Subject: Hello\r\nFrom: "Ann" <ann@example.com>\r\n\r\n'
+BODYSTRUCTURE_RESPONSE = [
+    (b'1 (UID 7 BODYSTRUCTURE ((("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 12 1 NIL NIL NIL)'
+     b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "BASE64" 40 1 NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL)'
+     b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 900 NIL ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL)'
+     b' "MIXED" ("BOUNDARY" "b1") NIL NIL) BODY[HEADER] {%d}' % len(HEADER), HEADER),
+    b')',
+]
+# Flag update imaplib buffered from an earlier NOOP, returned ahead of the real answer
+STALE_FETCH = b'2 (FLAGS (\\Seen))'
+
+
+class ParseFetchTest(unittest.TestCase):
+    def test_literal_and_nested_lists(self):
+        fetched = parse_fetch(BODYSTRUCTURE_RESPONSE)
+        self.assertEqual(fetched['UID'], '7')
+        self.assertEqual(fetched['BODY[HEADER]'], HEADER)
+        self.assertEqual(fetched['BODYSTRUCTURE'][-4], 'MIXED')
+
+    def test_partial_section_name_and_nil(self):
+        fetched = parse_fetch([(b'1 (UID 7 FLAGS (\\Seen) BODY[1]<0> {5}', b'hello'), b' X-GM-LABELS NIL)'])
+        self.assertEqual(fetched['BODY[1]'], b'hello')
+        self.assertEqual(fetched['FLAGS'], ['\\Seen'])
+        self.assertIsNone(fetched['X-GM-LABELS'])
+
+    def test_uid_picks_the_answer_over_a_stale_unsolicited_fetch(self):
+        fetched = parse_fetch([STALE_FETCH] + BODYSTRUCTURE_RESPONSE, uid=7)
+        self.assertEqual(fetched['BODY[HEADER]'], HEADER)
+        self.assertNotIn('FLAGS', fetched)
+        self.assertEqual(parse_fetch([STALE_FETCH], uid=7), {})
+
+    def test_unterminated_quote_raises(self):
+        for response in ([b'1 (UID 7 ENVELOPE ("Mon" "never closed'], [b'1 (UID 7 ENVELOPE ("ends in \\']):
+            with self.assertRaises(ValueError):
+                parse_fetch(response)
+
+    def test_truncated_literal_raises(self):
+        with self.assertRaises(ValueError):
+            parse_fetch([(b'1 (UID 7 BODY[1]<0> {50}', b'only a few bytes')])
+
+    def test_quoted_string_escapes(self):
+        fetched = parse_fetch([b'1 (UID 7 ENVELOPE ("Mon" "say \\"hi\\" \\\\ bye"))'])
+        self.assertEqual(fetched['ENVELOPE'], ['Mon', 'say "hi" \\ bye'])
+
+
+class FindTextPartTest(unittest.TestCase):
+    def test_prefers_plain_inside_alternative(self):
+        structure = parse_fetch(BODYSTRUCTURE_RESPONSE)['BODYSTRUCTURE']
+        self.assertEqual(find_text_part(structure), ("1.1", "quoted-printable", "iso-8859-1", "plain"))
+
+    def test_empty_or_malformed_structure(self):
+        self.assertIsNone(find_text_part([]))
+        self.assertIsNone(find_text_part(None))
+        self.assertIsNone(find_text_part(["TEXT", "PLAIN"]))
+
+    def test_single_part_message(self):
+        structure = ["TEXT", "HTML", ["CHARSET", "utf-8"], None, None, "7BIT", "10", "1"]
+        self.assertEqual(find_text_part(structure), ("1", "7bit", "utf-8", "html"))
+
+
+class _StaleFlagsMailbox:
+    """Answers UID FETCH like imaplib does when a NOOP had buffered a flag update first"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def uid(self, command, uid, spec):
+        self.calls += 1
+        if self.calls == 1:
+            return 'OK', [STALE_FETCH] + BODYSTRUCTURE_RESPONSE
+        body = b"Hi=20there"
+        return 'OK', [STALE_FETCH, (b'1 (UID 7 BODY[1.1]<0> {%d}' % len(body), body), b')']
+
+
+class FetchPreviewTest(unittest.TestCase):
+    def test_stale_unsolicited_fetch_before_the_answer(self):
+        preview = fetch_preview(_StaleFlagsMailbox(), 7)
+        self.assertEqual(preview['subject'], "Hello")
+        self.assertEqual(preview['body'], "Hi there")
+
+
+class DecodePrefixTest(unittest.TestCase):
+    def test_base64_cut_mid_quantum(self):
+        self.assertEqual(decode_prefix(b"aGVsbG8gd29y\r\nbGQ", "base64", "utf-8"), "hello wor")
+
+    def test_quoted_printable_cut_in_escape(self):
+        self.assertEqual(decode_prefix(b"caf=E9 cr=", "quoted-printable", "iso-8859-1"), "caf\xe9 cr")
+
+    def test_multibyte_character_cut_in_half(self):
+        self.assertEqual(decode_prefix("naïve".encode()[:3], "8bit", "utf-8"), "na")
+
+
+if __name__ == "__main__":
+    unittest.main()
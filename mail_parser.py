@@ -0,0 +1,194 @@
+from email.header import decode_header
+from email.parser import BytesHeaderParser
+
+from mail_fetch import decode_prefix, parse_fetch
+
+
+# Hard cap on what the parser may hold in memory for one message
+MAX_MESSAGE_BYTES = 1024 * 1024
+# Raw bytes of the text part kept; the bot only ever shows the first 1000 characters
+MAX_TEXT_BYTES = 64 * 1024
+STREAM_CHUNK = 64 * 1024
+
+
+class MessageTooLarge(Exception):
+    pass
+
+
+class MessageFetchError(Exception):
+    pass
+
+
+class _Part:
+    def __init__(self, headers):
+        self.contentType = headers.get_content_type()
+        self.charset = headers.get_content_charset() or "utf-8"
+        self.encoding = (headers.get("Content-Transfer-Encoding") or "7bit").strip().lower()
+        self.boundary = headers.get_boundary() if headers.get_content_maintype() == "multipart" else None
+        self.isAttachment = (headers.get_content_disposition() == "attachment")
+
+
+class StreamingTextParser:
+    """Feed raw message bytes; keeps headers and the first text/plain part, drops everything else"""
+
+    def __init__(self, max_bytes=MAX_MESSAGE_BYTES, max_text_bytes=MAX_TEXT_BYTES):
+        self.max_bytes = max_bytes
+        self.max_text_bytes = max_text_bytes
+        self.done = False
+
+        self.__pending = b""         # unfinished line
+        self.__skipLine = False      # rest of an over-long discarded line
+        self.__headerLines = []
+        self.__headerSize = 0
+        self.__inHeaders = True
+        self.__topHeaders = None
+        self.__part = None           # part whose body is being read
+        self.__boundaries = []       # open multipart boundaries, innermost last
+        self.__text = []
+        self.__textSize = 0
+        self.__textPart = None
+
+    def __buffered(self):
+        return len(self.__pending) + self.__headerSize + self.__textSize
+
+    def feed(self, data):
+        if self.done:
+            return
+        self.__pending += data
+        while not self.done:
+            end = self.__pending.find(b"\n")
+            if end < 0:
+                break
+            line = self.__pending[:end + 1]
+            self.__pending = self.__pending[end + 1:]
+            if self.__skipLine:
+                self.__skipLine = False
+                continue
+            self.__line(line)
+
+        if self.__capturing() and self.__textSize + len(self.__pending) >= self.max_text_bytes:
+            self.__text.append(self.__pending)
+            self.__textSize += len(self.__pending)
+            self.__pending = b""
+            self.done = True
+        elif len(self.__pending) > self.max_bytes // 2 and not self.__capturing():
+            # Attachment data without line breaks: it can't hold a boundary, drop it
+            self.__pending = b""
+            self.__skipLine = True
+        if self.__buffered() > self.max_bytes:
+            raise MessageTooLarge("message exceeds {} buffered bytes".format(self.max_bytes))
+
+    def __capturing(self):
+        return self.__part is not None and self.__part is self.__textPart
+
+    def __line(self, line):
+        if self.__inHeaders:
+            if line.strip():
+                self.__headerLines.append(line)
+                self.__headerSize += len(line)
+                return
+            self.__startPart(BytesHeaderParser().parsebytes(b"".join(self.__headerLines)))
+            return
+
+        stripped = line.rstrip(b"\r\n")
+        for depth in range(len(self.__boundaries) - 1, -1, -1):
+            boundary = b"--" + self.__boundaries[depth].encode()
+            if stripped == boundary or stripped == boundary + b"--":
+                self.__endPart()
+                del self.__boundaries[depth + 1:]
+                if stripped.endswith(b"--") and stripped != boundary:
+                    self.__boundaries.pop()
+                else:
+                    self.__beginHeaders()
+                return
+
+        if self.__capturing():
+            self.__text.append(line)
+            self.__textSize += len(line)
+            if self.__textSize >= self.max_text_bytes:
+                self.done = True
+
+    def __beginHeaders(self):
+        self.__inHeaders = True
+        self.__headerLines = []
+        self.__headerSize = 0
+
+    def __startPart(self, headers):
+        self.__inHeaders = False
+        self.__headerLines = []
+        self.__headerSize = 0
+        if self.__topHeaders is None:
+            self.__topHeaders = headers
+        part = _Part(headers)
+        if part.boundary:
+            self.__boundaries.append(part.boundary)
+            self.__part = None
+            return
+        self.__part = part
+        if self.__textPart is None and part.contentType == "text/plain" and not part.isAttachment:
+            self.__textPart = part
+
+    def __endPart(self):
+        if self.__capturing():
+            self.done = True
+        self.__part = None
+
+    def close(self):
+        """Return the email dict built from what was fed so far"""
+        if self.__topHeaders is None:
+            self.__startPart(BytesHeaderParser().parsebytes(b"".join(self.__headerLines)))
+        if self.__capturing() and self.__pending and not self.done:
+            self.__text.append(self.__pending)
+            self.__pending = b""
+        headers = self.__topHeaders
+
+        body = ""
+        if self.__textPart:
+            # The line that crossed the cap was kept whole; cut it back (decode_prefix copes)
+            raw = b"".join(self.__text)[:self.max_text_bytes]
+            body = decode_prefix(raw, self.__textPart.encoding, self.__textPart.charset)
+
+        subject = decode_header(headers["Subject"] or "")[0][0]
+        if isinstance(subject, bytes):
+            subject = subject.decode(errors="replace")
+        return {
+            'subject': subject,
+            'sender': headers["From"],
+            'date': headers["Date"],
+            'message_id': headers["Message-ID"],
+            'body': body,
+        }
+
+
+def parse_stream(chunks, **kwargs):
+    """Parse an iterable of byte chunks, stopping as soon as the text part is complete"""
+    parser = StreamingTextParser(**kwargs)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return parser.close()
+
+
+def stream_email(mail, uid, chunk_size=STREAM_CHUNK, **kwargs):
+    """Download a message in byte ranges, only as far as the parser needs"""
+    def chunks():
+        offset = 0
+        while True:
+            typ, data = mail.uid('fetch', str(uid), '(BODY.PEEK[]<{}.{}>)'.format(offset, chunk_size))
+            if typ != 'OK' or not data or data[0] is None:
+                return
+            # Only this message's answer; imaplib may also return buffered unsolicited FETCHes
+            fetched = parse_fetch(data, uid)
+            if 'BODY[]' not in fetched:
+                raise MessageFetchError("no BODY[] for UID {} at offset {}".format(uid, offset))
+            chunk = fetched['BODY[]'] or b""
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            offset += len(chunk)
+
+    return parse_stream(chunks(), **kwargs)
@@ -0,0 +1,106 @@
+import base64
+import unittest
+
+from mail_parser import MessageFetchError, MessageTooLarge, StreamingTextParser, parse_stream, stream_email
+
+
+MESSAGE = (
+    b"From: Ann <ann@example.com>\r\n"
+    b"Subject: =?utf-8?q?Caf=C3=A9_plans?=\r\n"
+    b"Message-ID: <m1@example.com>\r\n"
+    b"Content-Type: multipart/mixed; boundary=\"outer\"\r\n"
+    b"\r\n"
+    b"preamble\r\n"
+    b"--outer\r\n"
+    b"Content-Type: multipart/alternative; boundary=\"inner\"\r\n"
+    b"\r\n"
+    b"--inner\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"Content-Transfer-Encoding: quoted-printable\r\n"
+    b"\r\n"
+    b"See you at the caf=C3=A9.\r\n"
+    b"--outer is not a boundary here\r\n"
+    b"--inner\r\n"
+    b"Content-Type: text/html\r\n"
+    b"\r\n"
+    b"<p>html</p>\r\n"
+    b"--inner--\r\n"
+    b"--outer\r\n"
+    b"Content-Type: application/pdf\r\n"
+    b"Content-Disposition: attachment; filename=a.pdf\r\n"
+    b"Content-Transfer-Encoding: base64\r\n"
+    b"\r\n"
+) + base64.encodebytes(b"%PDF" * 3000) + b"--outer--\r\n"
+
+
+def _chunks(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+class StreamingTextParserTest(unittest.TestCase):
+    def test_nested_multipart_keeps_first_plain_part(self):
+        email_data = parse_stream([MESSAGE])
+        self.assertEqual(email_data['subject'], "Café plans")
+        self.assertEqual(email_data['message_id'], "<m1@example.com>")
+        self.assertEqual(email_data['body'], "See you at the café.\r\n--outer is not a boundary here\r\n")
+
+    def test_result_does_not_depend_on_chunking(self):
+        whole = parse_stream([MESSAGE])
+        for size in (1, 7, 64):
+            self.assertEqual(parse_stream(_chunks(MESSAGE, size)), whole)
+
+    def test_stops_reading_once_the_text_part_ends(self):
+        chunks = list(_chunks(MESSAGE, 64))
+        consumed = []
+        parse_stream(consumed.append(chunk) or chunk for chunk in chunks)
+        self.assertLess(len(consumed), len(chunks))
+
+    def test_text_is_capped(self):
+        message = b"Subject: long\r\n\r\n" + b"x" * 100 + b"\r\n"
+        self.assertEqual(len(parse_stream([message], max_text_bytes=10)['body']), 10)
+
+    def test_single_part_without_line_breaks_at_the_end(self):
+        email_data = parse_stream([b"Subject: short\r\n\r\nno newline"])
+        self.assertEqual(email_data['body'], "no newline")
+
+    def test_oversized_headers_are_refused(self):
+        parser = StreamingTextParser(max_bytes=1024)
+        with self.assertRaises(MessageTooLarge):
+            parser.feed(b"".join(b"X-Filler: %d\r\n" % i for i in range(200)))
+
+
+class _RangeFetchingMailbox:
+    """Answers UID FETCH BODY.PEEK[]<offset.size> the way imaplib returns it"""
+
+    def __init__(self, raw, stale=()):
+        self.raw = raw
+        self.stale = list(stale)  # unsolicited FETCH lines imaplib had buffered
+        self.requests = []
+
+    def uid(self, command, uid, spec):
+        offset, size = (int(n) for n in spec[spec.index("<") + 1:spec.index(">")].split("."))
+        self.requests.append(offset)
+        chunk = self.raw[offset:offset + size]
+        return 'OK', self.stale + [(b'1 (UID %s BODY[]<%d> {%d}' % (uid.encode(), offset, len(chunk)), chunk), b')']
+
+
+class StreamEmailTest(unittest.TestCase):
+    def test_fetches_only_the_ranges_it_needs(self):
+        mail = _RangeFetchingMailbox(MESSAGE)
+        email_data = stream_email(mail, 7, chunk_size=512)
+        self.assertEqual(email_data['body'], parse_stream([MESSAGE])['body'])
+        self.assertLess(len(mail.requests), len(MESSAGE) // 512)
+
+    def test_stale_unsolicited_fetch_before_the_answer(self):
+        mail = _RangeFetchingMailbox(MESSAGE, stale=[b'2 (FLAGS (\\Seen))'])
+        self.assertEqual(stream_email(mail, 7, chunk_size=512)['body'], parse_stream([MESSAGE])['body'])
+
+    def test_missing_chunk_raises(self):
+        mail = _RangeFetchingMailbox(MESSAGE)
+        mail.uid = lambda command, uid, spec: ('OK', [b'2 (FLAGS (\\Seen))'])
+        with self.assertRaises(MessageFetchError):
+            stream_email(mail, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+MAX_ATTEMPTS = 6
+# Due messages a worker claims and hands to deliver() at once
+DELIVERY_BATCH = 20
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 30 * 60
+
+
+class MailSpool:
+    """Disk-backed outbox so queued replies survive crashes and restarts"""
+
+    def __init__(self, path):
+        self.path = path
+        with self.__connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    to_email TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    reply_to_message_id TEXT,
+                    draft INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    last_error TEXT,
+                    created REAL NOT NULL
+                )""")
+            columns = [row['name'] for row in db.execute("PRAGMA table_info(outbox)")]
+            if 'draft' not in columns:
+                db.execute("ALTER TABLE outbox ADD COLUMN draft INTEGER NOT NULL DEFAULT 0")
+            db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)")
+            # Deliveries interrupted by a crash are retried
+            db.execute("UPDATE outbox SET status = 'queued' WHERE status = 'sending'")
+
+    @contextmanager
+    def __connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def enqueue(self, to_email, subject, body, reply_to_message_id=None, draft=False):
+        """Queue a message; a draft body is finished by the delivery job before it is sent"""
+        now = time.time()
+        with self.__connect() as db:
+            cursor = db.execute(
+                "INSERT INTO outbox (to_email, subject, body, reply_to_message_id, draft, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (to_email, subject, body, reply_to_message_id, int(draft), now, now))
+            return cursor.lastrowid
+
+    def set_body(self, message_id, body):
+        """Store the finished body of a draft so retries send it as is"""
+        with self.__connect() as db:
+            db.execute("UPDATE outbox SET body = ?, draft = 0 WHERE id = ?", (body, message_id))
+
+    def claim(self):
+        """Mark the next due message as 'sending' and return it, or None"""
+        rows = self.claim_batch(1)
+        return rows[0] if rows else None
+
+    def claim_batch(self, limit):
+        """Mark up to limit due messages as 'sending' and return them, oldest due first"""
+        with self.__connect() as db:
+            rows = db.execute(
+                "SELECT * FROM outbox WHERE status = 'queued' AND next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT ?", (time.time(), limit)).fetchall()
+            # Another worker may have claimed some of them since the SELECT
+            return [dict(row) for row in rows if db.execute(
+                "UPDATE outbox SET status = 'sending' WHERE id = ? AND status = 'queued'",
+                (row['id'],)).rowcount]
+
+    def next_due(self):
+        with self.__connect() as db:
+            row = db.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'queued'").fetchone()
+            return row[0]
+
+    def mark_sent(self, message_id):
+        with self.__connect() as db:
+            db.execute("UPDATE outbox SET status = 'sent', attempts = attempts + 1 WHERE id = ?",
+                       (message_id,))
+
+    def mark_failed(self, message_id, error, retry_at=None):
+        """Record a failed attempt; schedule a retry at retry_at or give up when it is None"""
+        with self.__connect() as db:
+            db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?, "
+                "next_attempt = COALESCE(?, next_attempt) WHERE id = ?",
+                ('queued' if retry_at else 'failed', str(error), retry_at, message_id))
+
+    def status(self, message_id):
+        with self.__connect() as db:
+            row = db.execute("SELECT * FROM outbox WHERE id = ?", (message_id,)).fetchone()
+            return dict(row) if row else None
+
+
+class SpoolWorker:
+    """Drains a MailSpool in the background with retries and a cap on deliveries in flight"""
+
+    def __init__(self, spool, deliver, on_result=None, concurrency=2,
+                 max_attempts=MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, batch_size=DELIVERY_BATCH):
+        self.spool = spool
+        self.deliver = deliver          # deliver(rows) returns an error or None per row, raises to fail all
+        self.on_result = on_result      # on_result(row, error) once a message is final
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+
+        self.__wake = threading.Event()
+        self.__stop = threading.Event()
+        self.__threads = []
+
+    def __retryDelay(self, attempts):
+        delay = min(self.base_delay * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+        return delay * random.uniform(0.8, 1.2)
+
+    def __process(self, rows):
+        try:
+            errors = self.deliver(rows)
+        except Exception as e:
+            errors = [e] * len(rows)
+        for row, error in zip(rows, errors):
+            self.__settle(row, error)
+
+    def __settle(self, row, error):
+        if error is None:
+            self.spool.mark_sent(row['id'])
+            self.__report(row, None)
+            return
+        attempts = row['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self.spool.mark_failed(row['id'], error)
+            print(f"[Spool] Giving up on message {row['id']} after {attempts} attempts: {error}")
+            self.__report(row, error)
+        else:
+            delay = self.__retryDelay(attempts)
+            self.spool.mark_failed(row['id'], error, time.time() + delay)
+            print(f"[Spool] Message {row['id']} failed ({error}), retrying in {delay:.0f}s")
+
+    def __report(self, row, error):
+        if self.on_result:
+            try:
+                self.on_result(row, error)
+            except Exception as e:
+                print(f"[Spool] Result callback failed: {e}")
+
+    def __loop(self):
+        while not self.__stop.is_set():
+            rows = self.spool.claim_batch(self.batch_size)
+            if rows:
+                self.__process(rows)
+                continue
+            due = self.spool.next_due()
+            timeout = 60 if due is None else max(0.0, min(60, due - time.time()))
+            self.__wake.wait(timeout)
+            self.__wake.clear()
+
+    def start(self):
+        if self.__threads:
+            return
+        self.__stop.clear()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self.__loop, daemon=True, name=f"spool-{i}")
+            thread.start()
+            self.__threads.append(thread)
+
+    def notify(self):
+        """Wake the workers after enqueueing"""
+        self.__wake.set()
+
+    def stop(self):
+        self.__stop.set()
+        self.__wake.set()
+        for thread in self.__threads:
+            thread.join(timeout=5)
+        self.__threads = []
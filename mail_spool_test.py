@@ -0,0 +1,69 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from mail_spool import MailSpool, SpoolWorker
+
+
+class SpoolWorkerTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.spool = MailSpool(self.path)
+        self.results = {}
+        self.done = threading.Event()
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def __onResult(self, row, error):
+        self.results[row['id']] = error
+        if len(self.results) == self.expected:
+            self.done.set()
+
+    def __run(self, deliver, expected, **kwargs):
+        self.expected = expected
+        worker = SpoolWorker(self.spool, deliver, self.__onResult, concurrency=1, **kwargs)
+        worker.start()
+        try:
+            self.assertTrue(self.done.wait(5))
+        finally:
+            worker.stop()
+
+    def test_due_messages_are_delivered_as_one_batch(self):
+        ids = [self.spool.enqueue("ann@example.com", "s%d" % i, "body") for i in range(3)]
+        batches = []
+
+        def deliver(rows):
+            batches.append([row['id'] for row in rows])
+            return [None] * len(rows)
+
+        self.__run(deliver, 3)
+        self.assertEqual(batches, [ids])
+        self.assertEqual([self.spool.status(i)['status'] for i in ids], ['sent'] * 3)
+
+    def test_failures_are_settled_per_message(self):
+        sent, lost = (self.spool.enqueue("ann@example.com", s, "body") for s in ("sent", "lost"))
+
+        def deliver(rows):
+            return [None if row['id'] == sent else RuntimeError("550 rejected") for row in rows]
+
+        self.__run(deliver, 2, max_attempts=1)
+        self.assertIsNone(self.results[sent])
+        self.assertEqual(self.spool.status(sent)['status'], 'sent')
+        self.assertEqual(self.spool.status(lost)['status'], 'failed')
+        self.assertEqual(self.spool.status(lost)['last_error'], "550 rejected")
+
+    def test_batch_size_limits_a_claim(self):
+        for i in range(5):
+            self.spool.enqueue("ann@example.com", "s%d" % i, "body")
+        self.assertEqual(len(self.spool.claim_batch(2)), 2)
+        self.assertEqual(len(self.spool.claim_batch(10)), 3)
+        self.assertEqual(self.spool.claim_batch(10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
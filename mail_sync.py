@@ -0,0 +1,81 @@
+import json
+import os
+import re
+import threading
+
+
+STATUS_PATTERN = re.compile(rb'(MESSAGES|UIDNEXT|UIDVALIDITY) (\d+)')
+FETCH_UID_PATTERN = re.compile(rb'^(\d+) \(.*\bUID (\d+)')
+
+
+class MailboxSync:
+    """Tracks UIDVALIDITY/UIDNEXT per mailbox so each poll only touches new UIDs"""
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self.__lock = threading.Lock()
+        self.__state = self.__load()
+
+    def __load(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __save(self):
+        tmpPath = self.state_path + ".tmp"
+        with open(tmpPath, 'w', encoding="utf-8") as file:
+            json.dump(self.__state, file)
+        os.replace(tmpPath, self.state_path)
+
+    def __status(self, mail, mailbox):
+        typ, data = mail.status(mailbox, '(MESSAGES UIDNEXT UIDVALIDITY)')
+        if typ != 'OK':
+            raise RuntimeError("STATUS failed for {}: {}".format(mailbox, data))
+        return {k.decode(): int(v) for k, v in STATUS_PATTERN.findall(data[0])}
+
+    def __newestUid(self, mail, count):
+        # Sequence number `count` is always the newest message, no SEARCH needed.
+        # imaplib may return buffered unsolicited FETCHes (flag updates) before the answer.
+        typ, data = mail.fetch(str(count), '(UID)')
+        for line in data or []:
+            if isinstance(line, tuple):
+                line = line[0]
+            match = FETCH_UID_PATTERN.match(line or b'')
+            if match and int(match.group(1)) == count:
+                return int(match.group(2))
+        raise RuntimeError("no UID in FETCH response for message {}: {}".format(count, data))
+
+    def poll(self, mail, key, mailbox='inbox'):
+        """Return the UIDs that arrived since the last poll (oldest first)"""
+        with self.__lock:
+            status = self.__status(mail, mailbox)
+            saved = self.__state.get(key)
+
+            if not saved or saved['uidvalidity'] != status['UIDVALIDITY']:
+                # First sync or the server renumbered the mailbox: old UIDs mean nothing now
+                if saved:
+                    print(f"[IMAP] UIDVALIDITY changed for {key}, resyncing")
+                newest = self.__newestUid(mail, status['MESSAGES']) if status['MESSAGES'] else None
+                newUids = [newest] if newest else []
+                saved = {'last_uid': None}
+            elif status['UIDNEXT'] > saved['uidnext']:
+                typ, data = mail.uid('search', None, 'UID {}:*'.format(saved['uidnext']))
+                # `n:*` always matches the highest UID, even when it is below n
+                newUids = sorted(int(u) for u in data[0].split() if int(u) >= saved['uidnext'])
+            else:
+                newUids = []
+
+            self.__state[key] = {
+                'uidvalidity': status['UIDVALIDITY'],
+                'uidnext': status['UIDNEXT'],
+                'last_uid': newUids[-1] if newUids else saved['last_uid'],
+            }
+            self.__save()
+            return newUids
+
+    def last_uid(self, key):
+        """UID of the newest message seen by the last poll, if any"""
+        with self.__lock:
+            return (self.__state.get(key) or {}).get('last_uid')
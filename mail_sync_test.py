@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+from mail_sync import MailboxSync
+
+
+class _Mailbox:
+    """STATUS / FETCH (UID) / UID SEARCH answers in imaplib's shapes for a list of UIDs"""
+
+    def __init__(self, uids, uidvalidity=1):
+        self.uids = list(uids)
+        self.uidvalidity = uidvalidity
+        self.stale = []  # unsolicited FETCH lines imaplib has buffered
+
+    def status(self, mailbox, items):
+        uidnext = (self.uids[-1] + 1) if self.uids else 1
+        return 'OK', [b'"INBOX" (MESSAGES %d UIDNEXT %d UIDVALIDITY %d)'
+                      % (len(self.uids), uidnext, self.uidvalidity)]
+
+    def fetch(self, sequence, items):
+        seq = int(sequence)
+        return 'OK', self.stale + [b'%d (UID %d)' % (seq, self.uids[seq - 1])]
+
+    def uid(self, command, charset, criteria):
+        low = int(criteria.split()[1].split(":")[0])
+        # `n:*` always includes the highest UID
+        found = [u for u in self.uids if u >= low] or self.uids[-1:]
+        return 'OK', [b" ".join(b"%d" % u for u in found)]
+
+
+class MailboxSyncTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_first_poll_takes_the_newest_message(self):
+        sync = MailboxSync(self.path)
+        self.assertEqual(sync.poll(_Mailbox([3, 5, 9]), "box"), [9])
+        self.assertEqual(sync.last_uid("box"), 9)
+
+    def test_watermark_advances_over_new_uids_only(self):
+        mailbox = _Mailbox([3, 5, 9])
+        sync = MailboxSync(self.path)
+        sync.poll(mailbox, "box")
+        self.assertEqual(sync.poll(mailbox, "box"), [])
+        mailbox.uids += [10, 12]
+        self.assertEqual(sync.poll(mailbox, "box"), [10, 12])
+        self.assertEqual(sync.last_uid("box"), 12)
+        # State survives a restart
+        self.assertEqual(MailboxSync(self.path).last_uid("box"), 12)
+
+    def test_uidvalidity_change_resyncs(self):
+        mailbox = _Mailbox([3, 5, 9])
+        sync = MailboxSync(self.path)
+        sync.poll(mailbox, "box")
+        mailbox.uids, mailbox.uidvalidity = [1, 2], 2
+        self.assertEqual(sync.poll(mailbox, "box"), [2])
+        self.assertEqual(sync.last_uid("box"), 2)
+
+    def test_stale_unsolicited_fetch_is_skipped(self):
+        mailbox = _Mailbox([3, 5, 9])
+        mailbox.stale = [b'2 (FLAGS (\\Seen))', b'3 (FLAGS (\\Seen))']
+        sync = MailboxSync(self.path)
+        self.assertEqual(sync.poll(mailbox, "box"), [9])
+
+    def test_missing_uid_keeps_the_watermark(self):
+        mailbox = _Mailbox([3, 5, 9])
+        sync = MailboxSync(self.path)
+        sync.poll(mailbox, "box")
+        mailbox.uidvalidity = 2
+        mailbox.fetch = lambda sequence, items: ('OK', [b'3 (FLAGS (\\Seen))'])
+        with self.assertRaises(RuntimeError):
+            sync.poll(mailbox, "box")
+        self.assertEqual(sync.last_uid("box"), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
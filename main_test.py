@@ -250,7 +250,7 @@ The bot will:
     if test_modes == 'y':
         print("\n1. Testing silent mode...")
         try:
-            silent_bot = Whatsapp(silent=True)
+            silent_bot = Whatsapp(silent=True, role="silent")
             print("Silent mode bot created successfully")
             silent_bot.browser.quit()
         except Exception as e:
@@ -258,7 +258,7 @@ The bot will:
         
         print("\n2. Testing headless mode...")
         try:
-            headless_bot = Whatsapp(headless=True)
+            headless_bot = Whatsapp(headless=True, role="headless")
             print("Headless mode bot created successfully")
             headless_bot.browser.quit()
         except Exception as e:
@@ -0,0 +1,130 @@
+import smtplib
+import socket
+import threading
+import time
+
+
+# Send a NOOP when the connection has been idle this long
+KEEPALIVE_INTERVAL = 60
+
+
+def _isConnectionError(error):
+    if isinstance(error, (smtplib.SMTPServerDisconnected, socket.timeout, ConnectionError)):
+        return True
+    # 421: service not available, the server is closing the channel
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code == 421
+
+
+class SmtpSender:
+    """One authenticated SMTP connection shared by every outgoing message"""
+
+    def __init__(self, host, port, user, password, starttls=True, timeout=30,
+                 keepalive=KEEPALIVE_INTERVAL):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.keepalive = keepalive
+
+        self.__server = None
+        self.__lastUsed = 0
+        self.__lock = threading.RLock()
+
+        self.__keepaliveStop = threading.Event()
+        self.__keepaliveThread = None
+
+    @classmethod
+    def from_config(cls, config, user, password, **kwargs):
+        """Build a sender from one of WhatsappEmailBot.email_configs entries"""
+        return cls(config['smtp_server'], config['smtp_port'], user, password,
+                   starttls=config.get('smtp_starttls', True), **kwargs)
+
+    def __connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.user:
+            server.login(self.user, self.password)
+        self.__server = server
+        self.__lastUsed = time.monotonic()
+
+    def __disconnect(self):
+        if self.__server is not None:
+            try:
+                self.__server.quit()
+            except Exception:
+                pass
+            self.__server = None
+
+    def __ensureConnected(self):
+        if self.__server is None:
+            self.__connect()
+        if self.__keepaliveThread is None and self.keepalive:
+            self.__startKeepalive()
+
+    def __sendOne(self, msg):
+        # One reconnect attempt when the server dropped or timed out the session
+        for attempt in range(2):
+            self.__ensureConnected()
+            try:
+                self.__server.send_message(msg)
+                self.__lastUsed = time.monotonic()
+                return
+            except Exception as e:
+                if not _isConnectionError(e):
+                    raise
+                self.__server.close()
+                self.__server = None
+                if attempt:
+                    raise
+                print(f"[SMTP] Connection lost ({e}), reconnecting")
+
+    def send(self, msg):
+        """Send a single message over the shared connection"""
+        with self.__lock:
+            self.__sendOne(msg)
+
+    def send_batch(self, messages):
+        """Send messages back to back on one connection; returns a list of errors (None = sent)"""
+        results = []
+        with self.__lock:
+            for msg in messages:
+                try:
+                    self.__sendOne(msg)
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    # ===================== KEEPALIVE =====================
+
+    def __keepaliveLoop(self):
+        while not self.__keepaliveStop.wait(self.keepalive / 2):
+            with self.__lock:
+                if self.__server is None or time.monotonic() - self.__lastUsed < self.keepalive:
+                    continue
+                try:
+                    code, _ = self.__server.noop()
+                    if code != 250:
+                        raise smtplib.SMTPServerDisconnected("NOOP returned {}".format(code))
+                    self.__lastUsed = time.monotonic()
+                except Exception as e:
+                    # Reconnect lazily on the next send
+                    print(f"[SMTP] Keepalive failed, dropping connection: {e}")
+                    self.__server.close()
+                    self.__server = None
+
+    def __startKeepalive(self):
+        self.__keepaliveStop.clear()
+        self.__keepaliveThread = threading.Thread(target=self.__keepaliveLoop, daemon=True)
+        self.__keepaliveThread.start()
+
+    def close(self):
+        self.__keepaliveStop.set()
+        if self.__keepaliveThread:
+            self.__keepaliveThread.join(timeout=5)
+            self.__keepaliveThread = None
+        with self.__lock:
+            self.__disconnect()
@@ -0,0 +1,108 @@
+import socket
+import socketserver
+import threading
+import unittest
+from email.message import EmailMessage
+
+from smtp_pool import SmtpSender
+
+
+class _SmtpStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of an SMTP server to accept plain, unauthenticated deliveries"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.clients = []
+        self.connections = 0
+        self.delivered = []
+        self.refuse_next = 0  # answer this many MAIL commands with 421
+
+    def drop_all(self):
+        """Close every client connection, like a server-side idle timeout"""
+        for client in self.clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.clients = []
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.clients.append(self.connection)
+        self.server.connections += 1
+        self.wfile.write(b"220 stand-in ready\r\n")
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250 stand-in\r\n")
+            elif command == b"MAIL" and self.server.refuse_next:
+                self.server.refuse_next -= 1
+                self.wfile.write(b"421 closing channel\r\n")
+                return
+            elif command == b"DATA":
+                self.wfile.write(b"354 go ahead\r\n")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.delivered.append(data)
+                self.wfile.write(b"250 queued\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 ok\r\n")
+
+
+def _message(subject):
+    msg = EmailMessage()
+    msg['From'] = "bot@example.com"
+    msg['To'] = "ann@example.com"
+    msg['Subject'] = subject
+    msg.set_content("hello")
+    return msg
+
+
+class SmtpSenderTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _SmtpStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.sender = SmtpSender(host, port, None, None, starttls=False, timeout=5, keepalive=0)
+
+    def tearDown(self):
+        self.sender.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_is_reused(self):
+        for i in range(3):
+            self.sender.send(_message("m%d" % i))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.delivered), 3)
+
+    def test_reconnects_after_a_server_drop(self):
+        self.sender.send(_message("before"))
+        self.server.drop_all()
+        self.sender.send(_message("after"))
+        self.assertEqual(self.server.connections, 2)
+        self.assertIn(b"Subject: after", self.server.delivered[-1])
+
+    def test_reconnects_after_421(self):
+        self.sender.send(_message("before"))
+        self.server.refuse_next = 1
+        self.sender.send(_message("after"))
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.delivered), 2)
+
+    def test_batch_reports_one_result_per_message(self):
+        self.server.refuse_next = 2  # the first message fails on the fresh connection too
+        errors = self.sender.send_batch([_message("lost"), _message("sent")])
+        self.assertIsNotNone(errors[0])
+        self.assertEqual(errors[1:], [None])
+        self.assertEqual(len(self.server.delivered), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import re
+
+
+# Prompt tokens allowed for the emails packed into one batched request
+BATCH_TOKEN_BUDGET = 6000
+BATCH_MAX_EMAILS = 10
+# Total email tokens a single summary may consume, and the size of each map chunk
+SUMMARY_TOKEN_BUDGET = int(os.getenv('LLM_TOKEN_BUDGET', '12000'))
+CHUNK_TOKENS = int(os.getenv('LLM_CHUNK_TOKENS', '3000'))
+
+MAP_TEMPLATE = """This is part {index} of {total} of a long email.
+Summarize this part, keeping names, dates, numbers, requests and deadlines:
+
+{content}"""
+
+REDUCE_TEMPLATE = """These are summaries of consecutive parts of one long email.
+Merge them into a single concise summary highlighting key points, action items and any urgent matters:
+
+{content}"""
+
+BATCH_TEMPLATE = """Summarize each of the following emails separately.
+Reply with JSON only, in exactly this shape:
+{{"summaries": [{{"id": 1, "summary": "..."}}, ...]}}
+Use the id given before each email and return one entry per email.
+
+{emails}"""
+
+
+_encoding = None
+_encodingLoaded = False
+
+
+def _getEncoding():
+    # tiktoken is optional and slow to import, so it is loaded on the first token count
+    global _encoding, _encodingLoaded
+    if not _encodingLoaded:
+        _encodingLoaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoding = None
+    return _encoding
+
+
+def estimate_tokens(text):
+    """Token count with tiktoken when installed, else ~4 characters per token"""
+    encoding = _getEncoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _splitHard(text, max_tokens):
+    encoding = _getEncoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+    size = max_tokens * 4
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS):
+    """Split text into chunks of at most max_tokens, preferring paragraph then sentence breaks"""
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            if estimate_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+            else:
+                pieces.extend(_splitHard(sentence, max_tokens))
+
+    chunks = []
+    current = []
+    used = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and used + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            used = 0
+        current.append(piece)
+        used += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def pack_batches(items, budget=BATCH_TOKEN_BUDGET, max_items=BATCH_MAX_EMAILS):
+    """Greedily group (key, content) pairs into batches that fit the token budget"""
+    batches = []
+    current = []
+    used = 0
+    for key, content in items:
+        tokens = estimate_tokens(content)
+        if current and (used + tokens > budget or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            used = 0
+        current.append((key, content))
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(contents):
+    emails = "\n\n".join(
+        "### Email {}\n{}".format(i + 1, content) for i, content in enumerate(contents))
+    return BATCH_TEMPLATE.format(emails=emails)
+
+
+def parse_batch_response(text, count):
+    """Return `count` summaries in order (None for missing ones), or None if the reply is unusable"""
+    if not text:
+        return None
+    # Models like to wrap JSON in ``` fences or add a sentence around it
+    match = re.search(r'\{.*\}', text, re.S)
+    if not match:
+        return None
+    try:
+        entries = json.loads(match.group(0))["summaries"]
+        byId = {int(entry["id"]): str(entry["summary"]).strip() for entry in entries}
+    except (ValueError, KeyError, TypeError):
+        return None
+    summaries = [byId.get(i + 1) or None for i in range(count)]
+    return summaries if any(summaries) else None
+
+
+async def _summarizeOne(fallback, content):
+    try:
+        return await fallback(content)
+    except Exception as e:
+        print(f"[Email] Error summarizing email: {e}")
+        return None
+
+
+async def summarize_batch(llm, model, contents, fallback):
+    """Summarize several emails with one request; async fallback(content) covers what can't be parsed"""
+    if len(contents) == 1:
+        return [await _summarizeOne(fallback, contents[0])]
+    try:
+        text = await llm.complete([{"role": "user", "content": build_batch_prompt(contents)}], model)
+        summaries = parse_batch_response(text, len(contents))
+    except Exception as e:
+        print(f"[Email] Batched summary failed: {e}")
+        summaries = None
+    if summaries is None:
+        print("[Email] Could not parse batched summaries, summarizing one by one")
+        summaries = [None] * len(contents)
+
+    async def fill(summary, content):
+        return summary or await _summarizeOne(fallback, content)
+
+    # Fallback calls for missing entries run in parallel
+    return list(await asyncio.gather(*(fill(s, c) for s, c in zip(summaries, contents))))
+
+
+async def map_reduce_summarize(llm, model, text, budget=SUMMARY_TOKEN_BUDGET, chunk_tokens=CHUNK_TOKENS):
+    """Summarize text of any length: chunk summaries run in parallel, then get merged"""
+    chunks = chunk_text(text, chunk_tokens)
+    maxChunks = max(1, budget // chunk_tokens)
+    if len(chunks) > maxChunks:
+        print(f"[Email] Email too long, summarizing the first {maxChunks} of {len(chunks)} parts")
+        chunks = chunks[:maxChunks]
+
+    async def summarizeChunk(index, chunk):
+        prompt = MAP_TEMPLATE.format(index=index + 1, total=len(chunks), content=chunk)
+        return await llm.complete([{"role": "user", "content": prompt}], model)
+
+    summaries = await asyncio.gather(*(summarizeChunk(i, c) for i, c in enumerate(chunks)))
+
+    # Merge in groups that fit one request until a single summary is left
+    while len(summaries) > 1:
+        groups = chunk_text("\n\n".join(summaries), chunk_tokens)
+        if len(groups) >= len(summaries):
+            groups = ["\n\n".join(summaries)]
+        summaries = await asyncio.gather(*(
+            llm.complete([{"role": "user", "content": REDUCE_TEMPLATE.format(content=g)}], model)
+            for g in groups))
+    return summaries[0]
@@ -0,0 +1,141 @@
+import time
+from contextlib import contextmanager
+
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+
+from lazy_import import lazy
+
+WebDriverWait = lazy("selenium.webdriver.support.wait", "WebDriverWait")
+
+
+DEFAULT_TIMEOUT = 10
+POLL_INTERVAL = 0.1
+
+# Page-side timestamp of the last DOM mutation, kept by an observer installed on first use
+DOM_QUIET_SCRIPT = """
+if (window.__waLastMutation === undefined) {
+    window.__waLastMutation = performance.now();
+    new MutationObserver(() => { window.__waLastMutation = performance.now(); })
+        .observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+}
+return performance.now() - window.__waLastMutation;
+"""
+
+# Milliseconds since the page finished its last network request (or -1 while still loading)
+NETWORK_QUIET_SCRIPT = """
+if (document.readyState !== 'complete') { return -1; }
+const entries = performance.getEntriesByType('resource');
+const lastEnd = entries.reduce((latest, entry) => Math.max(latest, entry.responseEnd), 0);
+return performance.now() - lastEnd;
+"""
+
+
+# ===================== READINESS PREDICATES =====================
+# Each takes the driver and returns something truthy once the condition holds
+
+def element_present(by, value):
+    def predicate(driver):
+        elements = driver.find_elements(by, value)
+        return elements[0] if elements else False
+    return predicate
+
+
+def element_visible(by, value):
+    def predicate(driver):
+        for element in driver.find_elements(by, value):
+            if element.is_displayed():
+                return element
+        return False
+    return predicate
+
+
+def element_clickable(by, value):
+    def predicate(driver):
+        for element in driver.find_elements(by, value):
+            if element.is_displayed() and element.is_enabled():
+                return element
+        return False
+    return predicate
+
+
+def dom_stable(quiet_ms=300):
+    """No DOM mutation for quiet_ms"""
+    def predicate(driver):
+        return driver.execute_script(DOM_QUIET_SCRIPT) >= quiet_ms
+    return predicate
+
+
+def network_idle(quiet_ms=500):
+    """Page loaded and no resource finished loading for quiet_ms"""
+    def predicate(driver):
+        return driver.execute_script(NETWORK_QUIET_SCRIPT) >= quiet_ms
+    return predicate
+
+
+def all_of(*predicates):
+    """Result of the last predicate once all hold"""
+    def predicate(driver):
+        result = True
+        for check in predicates:
+            result = check(driver)
+            if not result:
+                return False
+        return result
+    return predicate
+
+
+def any_of(*predicates):
+    """Result of the first predicate that holds"""
+    def predicate(driver):
+        for check in predicates:
+            result = check(driver)
+            if result:
+                return result
+        return False
+    return predicate
+
+
+# ===================== WAITING AND TIMINGS =====================
+
+class StageTimings:
+    """Wall time spent per named stage, to see where a flow waits"""
+
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            self.totals[name] = self.totals.get(name, 0) + elapsed
+            self.counts[name] = self.counts.get(name, 0) + 1
+            print("[Timing] {} {:.2f}s".format(name, elapsed))
+
+    def report(self):
+        for name in sorted(self.totals, key=self.totals.get, reverse=True):
+            print("[Timing] {:<32} {:>3}x {:7.2f}s".format(name, self.counts[name], self.totals[name]))
+
+
+timings = StageTimings()
+
+
+def wait_for(driver, predicate, timeout=DEFAULT_TIMEOUT, stage=None, required=True, poll=POLL_INTERVAL):
+    """Wait until predicate(driver) is truthy and return its result.
+
+    On timeout raises TimeoutException, or returns None when required is False.
+    """
+    wait = WebDriverWait(driver, timeout, poll_frequency=poll,
+                         ignored_exceptions=(NoSuchElementException, StaleElementReferenceException))
+    try:
+        if stage:
+            with timings.stage(stage):
+                return wait.until(predicate)
+        return wait.until(predicate)
+    except TimeoutException:
+        if required:
+            raise
+        return None
@@ -1,52 +1,77 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
-
 import csv
 import os
 import sys
-import time
 import asyncio
-import smtplib
-import imaplib
-import email
+import threading
+import queue
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.header import decode_header
-import openai
 from dotenv import load_dotenv
 import re
 from datetime import datetime
 
+from imap_pool import ImapSessionPool
+from mail_sync import MailboxSync
+from mail_fetch import fetch_preview
+from mail_parser import stream_email
+from smtp_pool import SmtpSender
+from mail_spool import MailSpool, SpoolWorker
+from llm_cache import get_summary_cache
+from llm_async import get_llm
+from whatsapp_hooks import MessageHook
+from whatsapp_extract import extract_messages
+from archive import get_archive
+from browser_manager import get_browser
+from summarizer import CHUNK_TOKENS, SUMMARY_TOKEN_BUDGET, estimate_tokens, map_reduce_summarize
+from whatsapp_send import Outbox, insert_message
+from command_executor import CommandExecutor
+from lazy_import import lazy
+from waits import (all_of, any_of, dom_stable, element_present, element_visible, network_idle,
+                   wait_for)
+
+# selenium.webdriver pulls in every browser driver; loaded on first use
+By = lazy("selenium.webdriver.common.by", "By")
+WebDriverWait = lazy("selenium.webdriver.support.wait", "WebDriverWait")
+EC = lazy("selenium.webdriver.support.expected_conditions")
+Keys = lazy("selenium.webdriver.common.keys", "Keys")
+ActionChains = lazy("selenium.webdriver.common.action_chains", "ActionChains")
+
 # Load environment variables
 load_dotenv()
 
-print("User data will be saved in: {}".format(
-    os.path.join(sys.path[0], "UserData")))
+# Raw bytes of email text fetched for summarizing (~4 chars per token plus transfer-encoding overhead)
+SUMMARY_SOURCE_BYTES = SUMMARY_TOKEN_BUDGET * 6
+
+SUMMARY_SYSTEM = "You are a helpful email assistant that provides concise summaries and analysis."
+SUMMARY_PROMPT = """
+            {context}
+            
+            Please analyze and summarize the following email content:
+            
+            {content}
+            
+            Provide a concise summary highlighting key points, action items, and any urgent matters.
+            """
+
+FORMAT_SYSTEM = "You are a professional email assistant that formats messages into proper business email format."
+FORMAT_PROMPT = """
+            Please format the following message into a professional email response:
+            
+            {content}
+            
+            Make it:
+            - Professional but friendly
+            - Well-structured with proper paragraphs
+            - Include appropriate greetings and closing
+            - Maintain the original meaning and intent
+            """
 
 
 class WhatsappEmailBot:
-    def __init__(self, executable_path=None, silent=False, headless=False):
-        self.options = webdriver.ChromeOptions()
-        if silent:
-            self.__addOption("--log-level=3")
-        if headless:
-            self.__addOption("--headless")
-            self.__addOption("--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36")
-            self.__addOption("--window-size=1920,1080")
-            self.__addOption("--no-sandbox")
-
-        self.__addOption(
-            "user-data-dir={}".format(os.path.join(sys.path[0], "UserData")))
-
-        if executable_path:
-            self.browser = webdriver.Chrome(
-                options=self.options, executable_path=executable_path)
-        else:
-            self.browser = webdriver.Chrome(options=self.options)
+    def __init__(self, executable_path=None, silent=False, headless=False, role="main"):
+        # One warm Chrome is shared with the Gmail automation; this bot drives its WhatsApp tab
+        self.browserManager = get_browser(role, executable_path, silent, headless)
+        self.browser = self.browserManager.tab_driver("whatsapp")
 
         # Email and AI configuration
         self.email_user = os.getenv('EMAIL_USER')
@@ -54,10 +79,10 @@ class WhatsappEmailBot:
         self.email_provider = os.getenv('EMAIL_PROVIDER', 'gmail')  # gmail, outlook, yahoo
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         self.target_whatsapp_chat = os.getenv('TARGET_WHATSAPP_CHAT', 'Me')
+        self.email_fetch_mode = os.getenv('EMAIL_FETCH_MODE', 'partial')  # partial, full
         
-        # Set up OpenAI
-        if self.openai_api_key:
-            openai.api_key = self.openai_api_key
+        # Set up OpenAI (the client itself is built on the first request)
+        self.summary_cache = get_summary_cache()
         
         # Email server configurations
         self.email_configs = {
@@ -81,12 +106,32 @@ class WhatsappEmailBot:
             }
         }
         
+        # Long-lived IMAP sessions, one pool per provider
+        self.imap_pools = {}
+        self.mail_sync = MailboxSync(os.path.join(sys.path[0], "mail_sync.json"))
+        self.smtp_senders = {}
+        self.mail_spool = MailSpool(os.path.join(sys.path[0], "mail_spool.db"))
+        self.spool_worker = None
+        # Status messages produced off the browser thread, sent by the hook loop
+        self.chat_notices = queue.Queue()
+        # Everything the bot says goes through here; drained on the browser thread
+        self.outbox = Outbox(self.__deliver)
+        self.currentChat = None
+        # Set to end the hook loop from a command running off the browser thread
+        self.stop_requested = threading.Event()
+        self.commands = None
+        # Thread driving the browser while hooked (None: whoever calls)
+        self.browserThread = None
+        self.new_email_pushed = threading.Event()
+
         # Store latest email for context
         self.latest_email = None
         self.pending_reply = None
 
-    def __addOption(self, option):
-        self.options.add_argument(option)
+    @property
+    def llm(self):
+        # The LLM executor thread is only started once a model call is made
+        return get_llm()
 
     def test(self):
         self.browser.get('https://www.google.com')
@@ -96,30 +141,28 @@ class WhatsappEmailBot:
         self.browser.get('https://web.whatsapp.com')
         if not self.__isLogin():
             print("Please scan the QR code")
-            print("After 3 sec - Screenshot of QR code will be saved in: {}".format(
+            print("Once it is drawn - Screenshot of QR code will be saved in: {}".format(
                 os.path.join(sys.path[0], "QRCode.png")))
-            time.sleep(3)
+            wait_for(self.browser, all_of(element_visible(By.TAG_NAME, "canvas"), dom_stable(500)),
+                     stage="whatsapp.qr_code", required=False)
             self.browser.save_screenshot(
                 os.path.join(sys.path[0], "QRCode.png"))
-            while not self.__isLogin():
+            while not wait_for(self.browser, element_present(By.CLASS_NAME, "two"), timeout=60, required=False):
                 pass
             print("Login successful")
+            # Lets a wiped profile come back logged in
+            self.browserManager.profile.snapshot()
         else:
             print("Already logged in")
+            if not os.path.isdir(self.browserManager.profile.snapshot_path):
+                self.browserManager.profile.snapshot()
 
     def __isLogin(self):
-        try:
-            # Landing Page (Login QR Code page)
-            self.browser.find_element(By.CLASS_NAME, "landing-wrapper")
-        except:
-            try:
-                # Logged in (Chat list)
-                self.browser.find_element(By.CLASS_NAME, "two")
-                return True
-            except:
-                time.sleep(3)
-                self.__isLogin()
-        return False
+        # Landing Page (Login QR Code page) or Logged in (Chat list), whichever loads first
+        page = wait_for(self.browser, any_of(
+            element_present(By.CLASS_NAME, "landing-wrapper"),
+            element_present(By.CLASS_NAME, "two")), timeout=60, stage="whatsapp.load", required=False)
+        return bool(page) and "two" in (page.get_attribute("class") or "").split()
 
     def __wait(self, cName, timeout=60):
         print("Waiting for element: {}".format(cName),
@@ -135,15 +178,31 @@ class WhatsappEmailBot:
     def __search(self, query):
         self.browser.find_element(
             By.CLASS_NAME, "copyable-text").send_keys(query)
-        time.sleep(0.25)
-        return self.browser.find_element(By.CLASS_NAME,"matched-text")
+        return wait_for(self.browser, element_present(By.CLASS_NAME, "matched-text"),
+                        timeout=5, stage="whatsapp.search")
 
     def __openChat(self, q):
         # Get the first chat from search results
         ActionChains(self.browser).move_to_element(
                     self.__search(q)).click().click().perform()
+        self.currentChat = q
+
+    def __deliver(self, chatName, msg):
+        if chatName and chatName != self.currentChat:
+            self.__openChat(chatName)
+            wait_for(self.browser, dom_stable(300), timeout=5, stage="whatsapp.open_chat", required=False)
+        self.sendMessage(msg)
 
     def sendMessage(self, msg):
+        # The whole message goes in with one paste (or CDP insertText) call
+        if not insert_message(self.browser, msg):
+            self.__typeMessage(msg)
+
+        # Send the message with Enter key
+        ActionChains(self.browser).send_keys(Keys.RETURN).perform()
+
+    def __typeMessage(self, msg):
+        # Slow path: type line by line with Shift+Enter between lines
         # Click on message box
         myElem = self.browser.find_element(
             By.XPATH,"//div[@class='x9f619 x12lumcd x1qrby5j xeuugli xisnujt x6prxxf x1fcty0u x1fc57z9 xe7vic5 x1716072 xgde2yp x89wmna xbjl0o0 x13fuv20 xu3j5b3 x1q0q8m5 x26u7qi x178xt8z xm81vs4 xso031l xy80clv x1lq5wgf xgqcy7u x30kzoy x9jhf4c x1a2a7pz x13w7htt x78zum5 x96k8nx xdvlbce x1ye3gou xn6708d x1ok221b xu06os2 x1i64zmx x1emribx']")
@@ -159,92 +218,85 @@ class WhatsappEmailBot:
             # Only add Shift+Enter if it's NOT the last line
             if i < len(lines) - 1:
                 ActionChains(self.browser).key_down(Keys.SHIFT).send_keys(Keys.RETURN).key_up(Keys.SHIFT).perform()
-       
-        # Send the message with Enter key
-        ActionChains(self.browser).send_keys(Keys.RETURN).perform()
 
     # ===================== EMAIL FUNCTIONALITY =====================
     
     def login_email_in_new_tab(self):
         """Login to email in a new browser tab"""
         try:
-            # Open new tab
-            self.browser.execute_script("window.open('');")
-            self.browser.switch_to.window(self.browser.window_handles[-1])
-            
             # Navigate to email provider
-            if self.email_provider == 'gmail':
-                self.browser.get('https://mail.google.com')
-            elif self.email_provider == 'outlook':
-                self.browser.get('https://outlook.live.com')
-            elif self.email_provider == 'yahoo':
-                self.browser.get('https://mail.yahoo.com')
-            
-            print(f"Opened {self.email_provider} in new tab. Please login manually if needed.")
-            time.sleep(5)
-            
-            # Switch back to WhatsApp tab
-            self.browser.switch_to.window(self.browser.window_handles[0])
+            urls = {
+                'gmail': 'https://mail.google.com',
+                'outlook': 'https://outlook.live.com',
+                'yahoo': 'https://mail.yahoo.com',
+            }
+            # The shared browser's email tab, the WhatsApp tab is re-selected on its next use
+            with self.browserManager.tab("email", urls.get(self.email_provider)) as browser:
+                print(f"Opened {self.email_provider} in new tab. Please login manually if needed.")
+                wait_for(browser, network_idle(), timeout=15, stage="email.open", required=False)
             
             return True
         except Exception as e:
             print(f"Error opening email tab: {e}")
             return False
 
+    def get_imap_pool(self):
+        """Return the persistent IMAP session pool for the current provider"""
+        if self.email_provider not in self.imap_pools:
+            self.imap_pools[self.email_provider] = ImapSessionPool.from_config(
+                self.email_configs[self.email_provider], self.email_user, self.email_password)
+        return self.imap_pools[self.email_provider]
+
+    def start_email_push(self):
+        """Get notified through IMAP IDLE when new mail arrives instead of polling"""
+        self.get_imap_pool().start_idle(self.new_email_pushed.set)
+
+    def stop_email_push(self):
+        for pool in self.imap_pools.values():
+            pool.stop_idle()
+
+    def __mailboxKey(self, mailbox='inbox'):
+        config = self.email_configs[self.email_provider]
+        return f"{self.email_user}@{config['imap_server']}/{mailbox}"
+
     def get_latest_email_via_imap(self):
         """Fetch the latest email using IMAP"""
+        def fetch(mail):
+            # Only look at UIDs above the stored watermark
+            self.mail_sync.poll(mail, self.__mailboxKey())
+            latest_uid = self.mail_sync.last_uid(self.__mailboxKey())
+            if not latest_uid:
+                return None, None
+
+            # Get the latest email
+            if self.email_fetch_mode == 'partial':
+                # Headers + start of the text part only, leaves the mail unread
+                return latest_uid, fetch_preview(mail, latest_uid, max_bytes=SUMMARY_SOURCE_BYTES)
+            # Streamed in byte ranges, attachments are skipped without being kept
+            return latest_uid, stream_email(mail, latest_uid, max_text_bytes=SUMMARY_SOURCE_BYTES)
+
         try:
-            config = self.email_configs[self.email_provider]
-            
-            # Connect to email server
-            mail = imaplib.IMAP4_SSL(config['imap_server'], config['imap_port'])
-            mail.login(self.email_user, self.email_password)
-            mail.select('inbox')
-            
-            # Search for all emails
-            status, messages = mail.search(None, 'ALL')
-            email_ids = messages[0].split()
-            
-            if not email_ids:
+            # A session the server dropped is replaced and the fetch retried on it
+            latest_uid, email_data = self.get_imap_pool().run(fetch)
+            if not latest_uid:
                 print("No emails found")
                 return None
-            
-            # Get the latest email
-            latest_email_id = email_ids[-1]
-            status, msg_data = mail.fetch(latest_email_id, '(RFC822)')
-            
-            # Parse email
-            email_message = email.message_from_bytes(msg_data[0][1])
-            
-            # Extract email details
-            subject = decode_header(email_message["Subject"])[0][0]
-            if isinstance(subject, bytes):
-                subject = subject.decode()
-            
-            sender = email_message["From"]
-            date = email_message["Date"]
-            
-            # Extract body
-            body = ""
-            if email_message.is_multipart():
-                for part in email_message.walk():
-                    if part.get_content_type() == "text/plain":
-                        body = part.get_payload(decode=True).decode()
-                        break
-            else:
-                body = email_message.get_payload(decode=True).decode()
-            
-            self.latest_email = {
-                'subject': subject,
-                'sender': sender,
-                'date': date,
-                'body': body[:1000] + "..." if len(body) > 1000 else body  # Limit body length
-            }
-            
-            mail.close()
-            mail.logout()
-            
-            print(f"Latest email fetched: {subject}")
+
+            if not email_data:
+                print("Latest email is no longer in the mailbox")
+                return None
+
+            try:
+                get_archive().add_email(email_data, self.__mailboxKey(), latest_uid)
+            except Exception as e:
+                print(f"[Archive] Could not store email: {e}")
+
+            # The summary works from the whole fetched text, WhatsApp only shows the start
+            body = email_data['full_body'] = email_data['body']
+            email_data['body'] = body[:1000] + "..." if len(body) > 1000 else body  # Limit body length
+            self.latest_email = email_data
+
+            print(f"Latest email fetched: {email_data['subject']}")
             return self.latest_email
             
         except Exception as e:
@@ -255,44 +307,42 @@ class WhatsappEmailBot:
         """Scrape the latest email from browser tab"""
         try:
             # Switch to email tab
-            if len(self.browser.window_handles) < 2:
+            if not self.browserManager.has_tab("email"):
                 print("Email tab not found. Opening email login...")
                 self.login_email_in_new_tab()
                 return None
             
-            self.browser.switch_to.window(self.browser.window_handles[-1])
-            
-            # Wait for emails to load
-            time.sleep(3)
-            
-            email_data = None
-            
-            if self.email_provider == 'gmail':
-                try:
-                    # Gmail scraping logic
-                    emails = self.browser.find_elements(By.CSS_SELECTOR, "[role='main'] tr")
-                    if emails:
-                        # Click on first email
-                        emails[0].click()
-                        time.sleep(2)
-                        
-                        # Extract email content
-                        subject = self.browser.find_element(By.CSS_SELECTOR, "h2").text
-                        sender = self.browser.find_element(By.CSS_SELECTOR, "[email]").get_attribute("email")
-                        body_element = self.browser.find_element(By.CSS_SELECTOR, "[dir='ltr']")
-                        body = body_element.text[:1000] + "..." if len(body_element.text) > 1000 else body_element.text
-                        
-                        email_data = {
-                            'subject': subject,
-                            'sender': sender,
-                            'body': body,
-                            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                except Exception as e:
-                    print(f"Gmail scraping error: {e}")
-            
-            # Switch back to WhatsApp tab
-            self.browser.switch_to.window(self.browser.window_handles[0])
+            with self.browserManager.tab("email") as browser:
+                # Wait for emails to load
+                wait_for(browser, element_present(By.CSS_SELECTOR, "[role='main'] tr"),
+                         timeout=15, stage="email.inbox", required=False)
+                
+                email_data = None
+                
+                if self.email_provider == 'gmail':
+                    try:
+                        # Gmail scraping logic
+                        emails = browser.find_elements(By.CSS_SELECTOR, "[role='main'] tr")
+                        if emails:
+                            # Click on first email
+                            emails[0].click()
+                            wait_for(browser, all_of(element_present(By.CSS_SELECTOR, "h2"), dom_stable(300)),
+                                     stage="email.open_message", required=False)
+                            
+                            # Extract email content
+                            subject = browser.find_element(By.CSS_SELECTOR, "h2").text
+                            sender = browser.find_element(By.CSS_SELECTOR, "[email]").get_attribute("email")
+                            body_element = browser.find_element(By.CSS_SELECTOR, "[dir='ltr']")
+                            body = body_element.text[:1000] + "..." if len(body_element.text) > 1000 else body_element.text
+                            
+                            email_data = {
+                                'subject': subject,
+                                'sender': sender,
+                                'body': body,
+                                'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            }
+                    except Exception as e:
+                        print(f"Gmail scraping error: {e}")
             
             if email_data:
                 self.latest_email = email_data
@@ -302,99 +352,89 @@ class WhatsappEmailBot:
             
         except Exception as e:
             print(f"Error scraping email: {e}")
-            self.browser.switch_to.window(self.browser.window_handles[0])
             return None
 
     # ===================== CHATGPT INTEGRATION =====================
     
+    async def send_to_chatgpt_async(self, content, context=""):
+        """Summarize email content; coroutine for running alongside other model calls"""
+        prompt = SUMMARY_PROMPT.format(context=context, content=content)
+        messages = [
+            {"role": "system", "content": SUMMARY_SYSTEM},
+            {"role": "user", "content": prompt}
+        ]
+
+        async def ask():
+            if estimate_tokens(content) > CHUNK_TOKENS:
+                # Long emails are chunked and summarized map-reduce style within the token budget
+                return await map_reduce_summarize(self.llm, "gpt-3.5-turbo", content)
+            return await self.llm.complete(messages, "gpt-3.5-turbo", max_tokens=500, temperature=0.7)
+
+        # Repeated "get email" on the same message is answered from the cache
+        return await self.summary_cache.cached_async(
+            "gpt-3.5-turbo", SUMMARY_SYSTEM + SUMMARY_PROMPT, context + "\n" + content, ask)
+
     def send_to_chatgpt(self, content, context=""):
         """Send content to ChatGPT and get response"""
         try:
-            prompt = f"""
-            {context}
-            
-            Please analyze and summarize the following email content:
-            
-            {content}
-            
-            Provide a concise summary highlighting key points, action items, and any urgent matters.
-            """
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful email assistant that provides concise summaries and analysis."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
-            
+            return self.llm.run(self.send_to_chatgpt_async(content, context))
         except Exception as e:
             print(f"ChatGPT API error: {e}")
             return f"Error processing with ChatGPT: {str(e)}"
 
+    async def format_email_response_with_chatgpt_async(self, response_content):
+        """Format a reply as an email; coroutine for running alongside other model calls"""
+        prompt = FORMAT_PROMPT.format(content=response_content)
+        messages = [
+            {"role": "system", "content": FORMAT_SYSTEM},
+            {"role": "user", "content": prompt}
+        ]
+
+        async def ask():
+            return await self.llm.complete(messages, "gpt-3.5-turbo", max_tokens=800, temperature=0.5)
+
+        return await self.summary_cache.cached_async(
+            "gpt-3.5-turbo", FORMAT_SYSTEM + FORMAT_PROMPT, response_content, ask)
+
     def format_email_response_with_chatgpt(self, response_content):
         """Format WhatsApp response into proper email format using ChatGPT"""
         try:
-            prompt = f"""
-            Please format the following message into a professional email response:
-            
-            {response_content}
-            
-            Make it:
-            - Professional but friendly
-            - Well-structured with proper paragraphs
-            - Include appropriate greetings and closing
-            - Maintain the original meaning and intent
-            """
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a professional email assistant that formats messages into proper business email format."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=800,
-                temperature=0.5
-            )
-            
-            return response.choices[0].message.content
-            
+            return self.llm.run(self.format_email_response_with_chatgpt_async(response_content))
         except Exception as e:
             print(f"ChatGPT formatting error: {e}")
             return response_content  # Return original if formatting fails
 
     # ===================== EMAIL SENDING =====================
     
+    def get_smtp_sender(self):
+        """Return the long-lived SMTP sender for the current provider"""
+        if self.email_provider not in self.smtp_senders:
+            self.smtp_senders[self.email_provider] = SmtpSender.from_config(
+                self.email_configs[self.email_provider], self.email_user, self.email_password)
+        return self.smtp_senders[self.email_provider]
+
+    def __buildEmail(self, to_email, subject, body, reply_to_message_id=None):
+        # Create message
+        msg = MIMEMultipart()
+        msg['From'] = self.email_user
+        msg['To'] = to_email
+        msg['Subject'] = subject
+
+        if reply_to_message_id:
+            msg['In-Reply-To'] = reply_to_message_id
+            msg['References'] = reply_to_message_id
+
+        # Add body
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+
     def send_email(self, to_email, subject, body, reply_to_message_id=None):
         """Send email via SMTP"""
         try:
-            config = self.email_configs[self.email_provider]
-            
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = self.email_user
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            if reply_to_message_id:
-                msg['In-Reply-To'] = reply_to_message_id
-                msg['References'] = reply_to_message_id
-            
-            # Add body
-            msg.attach(MIMEText(body, 'plain'))
+            msg = self.__buildEmail(to_email, subject, body, reply_to_message_id)
             
-            # Send email
-            server = smtplib.SMTP(config['smtp_server'], config['smtp_port'])
-            server.starttls()
-            server.login(self.email_user, self.email_password)
-            
-            text = msg.as_string()
-            server.sendmail(self.email_user, to_email, text)
-            server.quit()
+            # Send email over the shared, already authenticated connection
+            self.get_smtp_sender().send(msg)
             
             print(f"Email sent successfully to {to_email}")
             return True
@@ -403,6 +443,54 @@ class WhatsappEmailBot:
             print(f"Error sending email: {e}")
             return False
 
+    def start_email_spool(self):
+        """Start the background worker that delivers spooled emails"""
+        if self.spool_worker is None:
+            # Sends share one SMTP connection and are serialized by its lock; a second worker
+            # lets one reply be formatted by the model while another is on the wire
+            self.spool_worker = SpoolWorker(
+                self.mail_spool, self.__deliverSpooled, self.__reportSpooled,
+                concurrency=int(os.getenv('EMAIL_SPOOL_WORKERS', '2')))
+            self.spool_worker.start()
+
+    def stop_email_spool(self):
+        if self.spool_worker is not None:
+            self.spool_worker.stop()
+            self.spool_worker = None
+
+    def queue_email(self, to_email, subject, body, reply_to_message_id=None, draft=False):
+        """Spool an email for background delivery and return its spool id.
+
+        A draft body is formatted with ChatGPT by the delivery worker, not by the caller.
+        """
+        message_id = self.mail_spool.enqueue(to_email, subject, body, reply_to_message_id, draft)
+        self.start_email_spool()
+        self.spool_worker.notify()
+        return message_id
+
+    def __deliverSpooled(self, rows):
+        messages = []
+        for row in rows:
+            body = row['body']
+            if row['draft']:
+                body = self.format_email_response_with_chatgpt(body)
+                self.mail_spool.set_body(row['id'], body)
+            messages.append(self.__buildEmail(row['to_email'], row['subject'], body, row['reply_to_message_id']))
+
+        # Back to back on the shared connection, one error (or None) per message
+        errors = self.get_smtp_sender().send_batch(messages)
+        for row, error in zip(rows, errors):
+            if error is None:
+                print(f"Email sent successfully to {row['to_email']}")
+        return errors
+
+    def __reportSpooled(self, row, error):
+        # Called from a worker thread; the hook loop does the actual WhatsApp send
+        if error is None:
+            self.chat_notices.put(f"✅ Email reply sent successfully to {row['to_email']}")
+        else:
+            self.chat_notices.put(f"❌ Failed to send email reply to {row['to_email']}: {error}")
+
     # ===================== INTEGRATED WORKFLOW =====================
     
     def process_latest_email_to_whatsapp(self):
@@ -410,15 +498,19 @@ class WhatsappEmailBot:
         try:
             # Try IMAP first, fallback to browser scraping
             email_data = self.get_latest_email_via_imap()
-            if not email_data:
+            if not email_data and self.__isBrowserThread():
                 email_data = self.scrape_latest_email_from_browser()
+            elif not email_data:
+                # Scraping drives the browser, which is left to the hook thread
+                print("IMAP fetch failed; browser scraping is not done from a command worker")
             
             if not email_data:
                 print("No email data found")
                 return False
             
             # Format email content
-            email_content = f"""
+            def render(body):
+                return f"""
 📧 **New Email Alert**
 
 **From:** {email_data['sender']}
@@ -426,11 +518,14 @@ class WhatsappEmailBot:
 **Date:** {email_data['date']}
 
 **Content:**
-{email_data['body']}
+{body}
             """
+            email_content = render(email_data['body'])
             
-            # Send to ChatGPT for analysis
-            chatgpt_summary = self.send_to_chatgpt(email_content, "Analyze this email and provide a brief summary")
+            # Send to ChatGPT for analysis, using the untruncated body when we have it
+            chatgpt_summary = self.send_to_chatgpt(
+                render(email_data.get('full_body', email_data['body'])),
+                "Analyze this email and provide a brief summary")
             
             # Format final WhatsApp message
             whatsapp_message = f"""
@@ -443,11 +538,10 @@ class WhatsappEmailBot:
             """
             
             # Send to WhatsApp
-            self.__openChat(self.target_whatsapp_chat)
-            time.sleep(1)
-            self.sendMessage(whatsapp_message)
+            self.outbox.put(whatsapp_message, self.target_whatsapp_chat)
+            self.outbox.drain(force=True)
             
-            print("Email processed and sent to WhatsApp successfully!")
+            print("Email processed and handed to WhatsApp successfully!")
             return True
             
         except Exception as e:
@@ -463,9 +557,6 @@ class WhatsappEmailBot:
             # Extract reply content (remove "REPLY:" prefix)
             reply_content = reply_message.replace("REPLY:", "").strip()
             
-            # Format with ChatGPT
-            formatted_reply = self.format_email_response_with_chatgpt(reply_content)
-            
             # Extract sender email from latest email
             sender_match = re.search(r'<(.+?)>', self.latest_email['sender'])
             to_email = sender_match.group(1) if sender_match else self.latest_email['sender']
@@ -475,18 +566,33 @@ class WhatsappEmailBot:
             if not subject.startswith('Re:'):
                 subject = f"Re: {subject}"
             
-            # Send email
-            success = self.send_email(to_email, subject, formatted_reply)
-            
-            if success:
-                return f"✅ Email reply sent successfully to {to_email}"
-            else:
-                return "❌ Failed to send email reply"
+            # Hand off to the spool, which formats it with ChatGPT and reports delivery back to the chat
+            self.queue_email(to_email, subject, reply_content, self.latest_email.get('message_id'), draft=True)
+            return f"📤 Email reply to {to_email} queued for delivery"
                 
         except Exception as e:
             return f"❌ Error processing reply: {str(e)}"
 
-    def start_integrated_bot(self, monitor_chat):
+    def search_archive(self, query):
+        """Full-text search over archived chats and emails, formatted for WhatsApp"""
+        if not query:
+            return "🔎 Usage: search: words to look for"
+        try:
+            hits = get_archive().search(query)
+        except Exception as e:
+            return f"❌ Search failed: {str(e)}"
+        if not hits:
+            return f"🔎 No matches for \"{query}\""
+
+        lines = [f"🔎 *Results for \"{query}\":*"]
+        for i, hit in enumerate(hits, 1):
+            icon = "📧" if hit['kind'] == 'email' else "💬"
+            when = datetime.fromtimestamp(hit['sent_at']).strftime("%Y-%m-%d") if hit['sent_at'] else ""
+            lines.append(f"{i}. {icon} {hit['title']} — {hit['sender']} {when}".rstrip())
+            lines.append(f"   {hit['snippet']}")
+        return "\n".join(lines)
+
+    def start_integrated_bot(self, monitor_chat, push_email=False):
         """Start the integrated bot that monitors WhatsApp and handles email workflow"""
         
         async def integrated_message_handler(element, parsed_message):
@@ -494,17 +600,20 @@ class WhatsappEmailBot:
             
             print(f"\n📱 WhatsApp Message: {message}")
             
-            # Check for email commands
+            # Runs on a command worker: replies are queued and sent by the hook loop
             if message.lower() == "get email" or message.lower() == "check email":
-                self.sendMessage("🔄 Checking latest email...")
+                self.outbox.put("🔄 Checking latest email...", monitor_chat)
                 success = self.process_latest_email_to_whatsapp()
                 if not success:
-                    self.sendMessage("❌ Failed to fetch latest email")
+                    self.outbox.put("❌ Failed to fetch latest email", monitor_chat)
             
             elif message.upper().startswith("REPLY:"):
-                self.sendMessage("🔄 Processing email reply...")
+                self.outbox.put("🔄 Processing email reply...", monitor_chat)
                 result = self.process_whatsapp_reply_to_email(message)
-                self.sendMessage(result)
+                self.outbox.put(result, monitor_chat)
+            
+            elif message.lower().startswith("search:"):
+                self.outbox.put(self.search_archive(message.split(":", 1)[1].strip()), monitor_chat)
             
             elif message.lower() == "help":
                 help_text = """
@@ -512,43 +621,100 @@ class WhatsappEmailBot:
 
 📧 `get email` - Fetch and analyze latest email
 💬 `REPLY: your message` - Reply to latest email
+🔎 `search: words` - Search archived chats and emails
 ❓ `help` - Show this help
 🛑 `EXIT!` - Stop bot
                 """
-                self.sendMessage(help_text)
+                self.outbox.put(help_text, monitor_chat)
             
             elif message == "EXIT!":
-                self.sendMessage("👋 Email bot shutting down...")
-                self.browser.quit()
-                exit()
+                self.outbox.put("👋 Email bot shutting down...", monitor_chat)
+                self.stop_requested.set()
         
         try:
             print(f"🚀 Starting integrated email bot monitoring chat: {monitor_chat}")
-            self.hookIncomming(monitor_chat, integrated_message_handler)
+            if push_email:
+                self.start_email_push()
+            self.start_email_spool()
+            self.hookIncomming(monitor_chat, integrated_message_handler, background=True)
         except Exception as e:
             print(f"Error in integrated bot: {e}")
+        finally:
+            self.stop_email_push()
+            self.stop_email_spool()
+            if self.stop_requested.is_set():
+                self.browserManager.quit()
 
     # ===================== EXISTING WHATSAPP METHODS =====================
     
-    def hookIncomming(self, chatName, func):
+    def hookIncomming(self, chatName, func, background=False):
+        """Call func(element, parsed) for each new message in chatName.
+
+        With background, handlers run on a CommandExecutor so slow ones do not hold up the
+        hook; they must then talk through self.outbox instead of touching the browser.
+        """
         self.oldHookedMessage = None
-        asyncio.run(self.__hookIncomming(chatName, func))
+        self.stop_requested.clear()
+        self.commands = None
+        if background:
+            self.commands = CommandExecutor(
+                on_error=lambda e: self.outbox.put(f"❌ Command failed: {str(e)}", chatName))
+        # Only this thread drives the browser; drain() calls from workers leave sending to it
+        self.browserThread = threading.current_thread()
+        self.outbox.owner = self.browserThread
+        try:
+            asyncio.run(self.__hookIncomming(chatName, func))
+        finally:
+            if self.commands:
+                # Let running commands finish and send what they have to say
+                self.commands.shutdown()
+            self.outbox.drain(force=True)
+            self.outbox.owner = None
+            self.browserThread = None
+
+    def __isBrowserThread(self):
+        return self.browserThread is None or threading.current_thread() is self.browserThread
 
     async def __hookIncomming(self, chatName, func):
         self.__openChat(chatName)
-        time.sleep(0.1)
         self.__wait("message-in")
 
-        message = self.browser.find_elements(By.CLASS_NAME, "message-in")[-1]
-
-        while True:
-            while self.oldHookedMessage == message:
-                await asyncio.sleep(0.1)
-                message = self.browser.find_elements(
-                    By.CLASS_NAME, "message-in")[-1]
-
-            await asyncio.create_task(func(message, self.__parseMessage(message)))
-            self.oldHookedMessage = message
+        # New messages are buffered page-side and handed over in one long-poll call
+        self.messageHook = MessageHook(self.browser, "message-in")
+        self.messageHook.install()
+
+        while not self.stop_requested.is_set():
+            if self.new_email_pushed.is_set():
+                self.__forwardPushedEmail(chatName)
+            while not self.chat_notices.empty():
+                self.outbox.put(self.chat_notices.get_nowait(), chatName)
+            self.outbox.drain()
+            if self.currentChat != chatName:
+                # Sending moved to another chat. Messages that arrived meanwhile sit after the
+                # hook's watermark and are delivered on the next drain; re-rendered old ones are skipped
+                self.__openChat(chatName)
+                self.__wait("message-in")
+
+            messages = self.messageHook.drain()
+            parsed = extract_messages(self.browser, messages)
+            if parsed is None:
+                parsed = [self.__parseMessage(message) for message in messages]
+            for message, msg in zip(messages, parsed):
+                if self.commands is None:
+                    await asyncio.create_task(func(message, msg))
+                elif self.commands.submit(func, message, msg, key=chatName) is None:
+                    self.outbox.put("⏳ Still busy with earlier commands, please try again shortly", chatName)
+                self.oldHookedMessage = message
+            await asyncio.sleep(0)
+
+    def __forwardPushedEmail(self, chatName):
+        self.new_email_pushed.clear()
+        print("📬 New email pushed by IMAP IDLE")
+        # The fetch and summary take a while: run on the worker pool when there is one, queued
+        # behind the chat's commands since they share self.latest_email
+        if (self.commands is None
+                or self.commands.submit(self.process_latest_email_to_whatsapp, key=chatName) is None):
+            self.process_latest_email_to_whatsapp()
 
     def __parseMessage(self, message):
         try:
@@ -0,0 +1,157 @@
+import time
+from datetime import datetime
+
+from selenium.common.exceptions import JavascriptException, StaleElementReferenceException
+
+
+# Same fields and workarounds as Whatsapp.__parseMessage, evaluated page-side for every node
+# at once, plus the message data-id and data-pre-plain-text. arguments[0] is a list of
+# message elements, or null to use every element matching the class selector in
+# arguments[1]; with a data-id in arguments[2] only the nodes before that message are parsed.
+EXTRACT_SCRIPT = """
+let nodes = Array.from(arguments[0] || document.querySelectorAll('.' + arguments[1]));
+const idOf = (node) => {
+    const holder = node.closest('[data-id]');
+    return holder ? holder.getAttribute('data-id') : null;
+};
+if (arguments[2]) {
+    const at = nodes.findIndex((node) => idOf(node) === arguments[2]);
+    if (at >= 0) { nodes = nodes.slice(0, at); }
+}
+const textOf = (el) => el ? el.innerText : null;
+const header = document.querySelector('._3W2ap');
+const chatName = header ? header.innerText : "NONE";
+const rows = [];
+for (const message of nodes) {
+    let msg = textOf(message.querySelector('._21Ahp'));
+    if (msg === null) { msg = "MEDIA"; }
+
+    let repliedTo = "NONE", repliedMsg = textOf(message.querySelector('.quoted-mention._11JPr'));
+    if (repliedMsg === null) {
+        repliedMsg = "NONE";
+    } else {
+        const others = message.querySelectorAll('._3FuDI._11JPr');
+        repliedTo = others.length ? others[others.length - 1].innerText : "You";
+        for (const z of message.querySelectorAll('._11JPr')) {
+            if (z.innerText.includes("You")) { repliedTo = "You"; }
+        }
+    }
+
+    const dates = message.querySelectorAll('.l7jjieqr.fewfhwl7');
+    const date = dates.length ? dates[dates.length - 1].innerText : "NONE";
+
+    let sender = textOf(message.querySelector('._3IzYj._6rIWC.p357zi0d'));
+    if (sender === null) {
+        if (message.classList.contains('message-out')) {
+            sender = "You";
+        } else {
+            const copyable = message.querySelector('.copyable-text');
+            const plain = copyable ? copyable.getAttribute('data-pre-plain-text') : null;
+            sender = plain !== null ? plain.slice(plain.indexOf("] ") + 2, -2) : chatName;
+        }
+    }
+
+    if (msg === "") { msg = "Emoji"; }
+    if (repliedMsg === "") { repliedMsg = "Emoji"; }
+    if (repliedMsg.length === 4 && repliedMsg[1] === ":") { repliedMsg = "VOICE NOTE"; }
+    const stamp = message.querySelector('[data-pre-plain-text]');
+    rows.push([date, sender, msg, repliedTo, repliedMsg, idOf(message) || "",
+               stamp ? stamp.getAttribute('data-pre-plain-text') : ""]);
+}
+return rows;
+"""
+
+
+def extract_messages(browser, elements=None, className="message-in", before=None, with_ids=False):
+    """Parse messages into (date, sender, text, repliedTo, repliedMsg) tuples in one WebDriver call.
+
+    Pass the message elements, or leave them out to parse every element with the class
+    (only those before the message with data-id `before`, if given). with_ids appends the
+    data-id and the data-pre-plain-text stamp to each tuple. Returns None if the script
+    fails so callers can fall back to per-element parsing.
+    """
+    if elements is not None and not elements:
+        return []
+    try:
+        rows = browser.execute_script(
+            EXTRACT_SCRIPT, list(elements) if elements is not None else None, className, before)
+    except (JavascriptException, StaleElementReferenceException) as e:
+        print("Bulk extraction failed, parsing one by one: {}".format(e))
+        return None
+    return [tuple(row) if with_ids else tuple(row[:5]) for row in rows]
+
+
+# Seconds the history must stay unchanged at scrollTop 0 before it counts as the real top
+HISTORY_SETTLE = 3.0
+HISTORY_POLL = 0.25
+
+# Scrolls the message pane to the top (which makes WhatsApp load older history) and
+# reports [message count, oldest data-id, scrollTop, oldest data-pre-plain-text]
+SCROLL_TOP_SCRIPT = """
+const nodes = document.querySelectorAll('.' + arguments[0]);
+if (!nodes.length) { return null; }
+const first = nodes[0];
+let pane = first.parentElement;
+while (pane && pane.scrollHeight <= pane.clientHeight) { pane = pane.parentElement; }
+if (pane) { pane.scrollTop = 0; }
+const holder = first.closest('[data-id]');
+let plain = null;
+for (let i = 0; i < nodes.length && i < 20 && plain === null; i++) {
+    const copyable = nodes[i].querySelector('[data-pre-plain-text]');
+    if (copyable) { plain = copyable.getAttribute('data-pre-plain-text'); }
+}
+return [nodes.length, holder ? holder.getAttribute('data-id') : null, pane ? pane.scrollTop : 0, plain];
+"""
+
+
+def parse_plain_date(plain, date_format="%m/%d/%Y"):
+    """Date out of data-pre-plain-text ("[10:32, 3/14/2023] Name: "), or None"""
+    stamp = parse_plain_timestamp(plain, date_format)
+    return stamp.date() if stamp else None
+
+
+def parse_plain_timestamp(plain, date_format="%m/%d/%Y"):
+    """Datetime out of data-pre-plain-text ("[10:32, 3/14/2023] Name: "), or None"""
+    try:
+        clock, day = plain[plain.index("[") + 1:plain.index("]")].split(",", 1)
+        return datetime.strptime(day.strip() + " " + clock.strip(), date_format + " %H:%M")
+    except (AttributeError, ValueError):
+        return None
+
+
+def load_history(browser, className, since=None, limit=None, date_format="%m/%d/%Y",
+                 settle=HISTORY_SETTLE, poll=HISTORY_POLL, on_window=None):
+    """Scroll a chat up until the real top, a message older than `since` (a date) or `limit` messages.
+
+    Progress is read from a few numbers per step instead of page_source snapshots.
+    on_window(previousOldestId) is called whenever older messages were loaded.
+    Returns the number of messages loaded.
+    """
+    seen = None
+    changedAt = time.time()
+    count = 0
+    while True:
+        state = browser.execute_script(SCROLL_TOP_SCRIPT, className)
+        if state is None:
+            return 0
+        count, oldestId, scrollTop, plain = state
+
+        # Hand over a new window before any of the stop checks, so the last one is not lost
+        changed = (count, oldestId) != seen
+        if changed:
+            if seen and on_window:
+                on_window(seen[1])
+            seen = (count, oldestId)
+            changedAt = time.time()
+
+        if limit and count >= limit:
+            print("History loaded: {} messages (limit reached)".format(count))
+            return count
+        oldest = parse_plain_date(plain, date_format) if since else None
+        if oldest and oldest <= since:
+            print("History loaded: {} messages back to {}".format(count, oldest))
+            return count
+        if not changed and scrollTop == 0 and time.time() - changedAt >= settle:
+            print("History loaded: {} messages (top of chat)".format(count))
+            return count
+        time.sleep(poll)
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+
+from selenium.common.exceptions import JavascriptException, TimeoutException
+
+
+# Seconds a drain() call waits page-side for new messages before returning empty
+LONG_POLL_TIMEOUT = 1.0
+# How many delivered message ids are remembered to drop re-rendered duplicates
+SEEN_LIMIT = 2000
+
+# Buffers every added node matching the class in window.__waHooks[cls].queue
+# and returns the data-id of the message `backlog` places before the newest one
+# ("" when the backlog covers every message on screen)
+INSTALL_SCRIPT = """
+const cls = arguments[0], backlog = arguments[1];
+window.__waHooks = window.__waHooks || {};
+if (!window.__waHooks[cls]) {
+    const hook = window.__waHooks[cls] = {queue: [], waiter: null};
+    const observer = new MutationObserver((mutations) => {
+        for (const mutation of mutations) {
+            for (const node of mutation.addedNodes) {
+                if (node.nodeType !== 1) { continue; }
+                if (node.classList.contains(cls)) { hook.queue.push(node); }
+                for (const inner of node.getElementsByClassName(cls)) { hook.queue.push(inner); }
+            }
+        }
+        if (hook.waiter && hook.queue.length) {
+            const wake = hook.waiter;
+            hook.waiter = null;
+            wake();
+        }
+    });
+    observer.observe(document.body, {childList: true, subtree: true});
+}
+const nodes = document.getElementsByClassName(cls);
+if (!nodes.length) { return null; }
+if (backlog >= nodes.length) { return ""; }
+const mark = nodes[nodes.length - 1 - backlog].closest('[data-id]');
+return mark ? mark.getAttribute('data-id') : null;
+"""
+
+# Long-poll: returns [element, data-id] pairs for every message after the watermark,
+# in document order, as soon as there is one or after the timeout
+DRAIN_SCRIPT = """
+const cls = arguments[0], timeoutMs = arguments[1], watermark = arguments[2];
+const done = arguments[arguments.length - 1];
+const hook = (window.__waHooks || {})[cls];
+if (!hook) { done(null); return; }
+const idOf = (node) => {
+    const holder = node.closest('[data-id]');
+    return holder ? holder.getAttribute('data-id') : null;
+};
+const pending = () => {
+    const queued = hook.queue.splice(0);
+    const nodes = Array.from(document.getElementsByClassName(cls));
+    const at = watermark ? nodes.findIndex((node) => idOf(node) === watermark) : -1;
+    // Watermark scrolled away or chat re-opened: fall back to what the observer saw
+    const fresh = at >= 0 || watermark === "" ? nodes.slice(at + 1) : queued.filter((node) => node.isConnected);
+    return fresh.map((node) => [node, idOf(node)]);
+};
+const first = pending();
+if (first.length) { done(first); return; }
+const timer = setTimeout(() => { hook.waiter = null; done([]); }, timeoutMs);
+hook.waiter = () => { clearTimeout(timer); done(pending()); };
+"""
+
+
+class MessageHook:
+    """Detects new message nodes with an injected MutationObserver instead of DOM polling.
+
+    Delivery is tracked by the messages' data-id: everything after the last delivered
+    id is returned in order, and ids already delivered are never returned twice.
+    """
+
+    def __init__(self, browser, className="message-in", timeout=LONG_POLL_TIMEOUT):
+        self.browser = browser
+        self.className = className
+        self.timeout = timeout
+        self.watermark = None
+        self.__seen = OrderedDict()
+
+    def install(self, backlog=0):
+        """Start observing; the newest `backlog` messages already on screen count as new"""
+        mark = self.browser.execute_script(INSTALL_SCRIPT, self.className, backlog)
+        # Only the first install sets the watermark; a re-install after a reload keeps it
+        # so messages that arrived meanwhile are still delivered
+        if self.watermark is None and mark is not None:
+            self.watermark = mark
+            if mark:
+                self.__remember(mark)
+
+    def __remember(self, messageId):
+        self.__seen[messageId] = True
+        self.__seen.move_to_end(messageId)
+        while len(self.__seen) > SEEN_LIMIT:
+            self.__seen.popitem(last=False)
+
+    def drain(self):
+        """Return the message elements added since the last drain, oldest first"""
+        self.browser.set_script_timeout(self.timeout + 5)
+        try:
+            found = self.browser.execute_async_script(
+                DRAIN_SCRIPT, self.className, int(self.timeout * 1000), self.watermark)
+        except (JavascriptException, TimeoutException):
+            found = None
+        if found is None:
+            # Page reloaded (or navigated) and lost the observer
+            self.install()
+            return []
+
+        messages = []
+        for element, messageId in found:
+            # Nodes without a data-id fall back to the WebDriver element reference
+            key = messageId or element.id
+            if key in self.__seen:
+                continue
+            self.__remember(key)
+            if messageId:
+                self.watermark = messageId
+            messages.append(element)
+        return messages
+
+
+# Chat list rows (the _11JPr titles getChats reads) of the wanted chats that show an unread badge
+CHAT_LIST_SCRIPT = """
+const wanted = new Set(arguments[0]);
+const found = [], rows = new Set();
+for (const title of document.querySelectorAll('#pane-side span._11JPr[title]')) {
+    const name = title.getAttribute('title');
+    if (!wanted.has(name.toLowerCase())) { continue; }
+    const row = title.closest('[role="listitem"], [role="row"]') || title.parentElement;
+    if (rows.has(row)) { continue; }
+    rows.add(row);
+    const badge = row.querySelector('[aria-label*="unread"]');
+    if (!badge) { continue; }
+    found.push([name, parseInt(badge.textContent, 10) || 1, row]);
+}
+return found;
+"""
+
+
+class ChatListWatcher:
+    """Finds monitored chats with unread messages from the chat list in one call"""
+
+    def __init__(self, browser):
+        self.browser = browser
+
+    def unread(self, chatNames):
+        """Return (chatName, unreadCount, rowElement) for every listed chat with unread messages"""
+        byTitle = {name.lower(): name for name in chatNames}
+        try:
+            found = self.browser.execute_script(CHAT_LIST_SCRIPT, list(byTitle))
+        except JavascriptException:
+            return []
+        return [(byTitle[title.lower()], count, row) for title, count, row in found or []]
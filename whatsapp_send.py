@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import deque
+
+from selenium.common.exceptions import JavascriptException, TimeoutException, WebDriverException
+
+
+# WhatsApp's editor updates the DOM asynchronously; how long to wait for pasted text to show up
+INSERT_SETTLE_MS = 500
+
+COMPOSER_SELECTOR = 'footer div[contenteditable="true"]'
+
+# Adjacent messages to one chat queued this close together are sent as one
+COALESCE_SECONDS = 1.0
+# WhatsApp folds long text behind "Read more" and refuses it past 65536 characters
+MAX_MESSAGE_LENGTH = 4096
+# Token bucket: sustained sends per second, and how many may go out back to back
+SEND_RATE = 1.0
+SEND_BURST = 5
+
+# Focus the composer and paste the whole message into it at once, the way a user's
+# clipboard paste would; resolves true once the composer holds the text
+PASTE_SCRIPT = """
+const text = arguments[0], settleMs = arguments[1], selector = arguments[2];
+const done = arguments[arguments.length - 1];
+const box = document.querySelector(selector);
+if (!box) { done(false); return; }
+box.focus();
+const data = new DataTransfer();
+data.setData('text/plain', text);
+box.dispatchEvent(new ClipboardEvent('paste', {clipboardData: data, bubbles: true, cancelable: true}));
+const norm = (value) => value.replace(/\\s+/g, ' ').trim();
+const started = performance.now();
+const check = () => {
+    if (norm(box.innerText) === norm(text)) { done(true); return; }
+    if (performance.now() - started > settleMs) { done(false); return; }
+    requestAnimationFrame(check);
+};
+check();
+"""
+
+# Same check for text inserted by other means, clearing the composer when it does not match
+VERIFY_SCRIPT = """
+const text = arguments[0], settleMs = arguments[1], selector = arguments[2];
+const done = arguments[arguments.length - 1];
+const box = document.querySelector(selector);
+if (!box) { done(false); return; }
+const norm = (value) => value.replace(/\\s+/g, ' ').trim();
+const started = performance.now();
+const check = () => {
+    if (norm(box.innerText) === norm(text)) { done(true); return; }
+    if (performance.now() - started > settleMs) {
+        box.focus();
+        document.execCommand('selectAll', false, null);
+        document.execCommand('delete', false, null);
+        done(false);
+        return;
+    }
+    requestAnimationFrame(check);
+};
+check();
+"""
+
+
+def _verify(browser, text):
+    return browser.execute_async_script(VERIFY_SCRIPT, text, INSERT_SETTLE_MS, COMPOSER_SELECTOR)
+
+
+def insert_message(browser, text):
+    """Put the whole (multi-line) message into the open chat's composer in one or two calls.
+
+    Tries a synthetic paste, then CDP Input.insertText. Returns False with the composer
+    left empty when neither worked, so the caller can type the message instead.
+    """
+    browser.set_script_timeout(INSERT_SETTLE_MS / 1000 + 5)
+    try:
+        if browser.execute_async_script(PASTE_SCRIPT, text, INSERT_SETTLE_MS, COMPOSER_SELECTOR):
+            return True
+        # The paste may have half-worked; start from an empty composer
+        _verify(browser, "")
+    except (JavascriptException, TimeoutException):
+        return False
+
+    try:
+        browser.execute_script("document.querySelector(arguments[0]).focus()", COMPOSER_SELECTOR)
+        browser.execute_cdp_cmd("Input.insertText", {"text": text})
+        return bool(_verify(browser, text))
+    except (AttributeError, WebDriverException):
+        # Not a Chromium driver, or the composer went away
+        return False
+
+
+# ===================== OUTBOX =====================
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Cut text into pieces of at most limit characters, at paragraph, line or word boundaries"""
+    chunks = []
+    text = text.strip()
+    while len(text) > limit:
+        # Prefer the last paragraph break in the second half of the window, then a line, then a word
+        for separator in ("\n\n", "\n", " "):
+            cut = text.rfind(separator, limit // 2, limit)
+            if cut != -1:
+                break
+        else:
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class Outbox:
+    """Outgoing WhatsApp messages, coalesced per chat, split to size and sent at a bounded rate.
+
+    put() may be called from any thread; drain() does the sending through deliver(chatName, text),
+    so it belongs on the thread driving the browser. clock and sleep can be replaced in tests.
+    """
+
+    def __init__(self, deliver, coalesce_seconds=COALESCE_SECONDS, max_length=MAX_MESSAGE_LENGTH,
+                 rate=SEND_RATE, burst=SEND_BURST, clock=time.time, sleep=time.sleep):
+        self.deliver = deliver
+        self.coalesce_seconds = coalesce_seconds
+        self.max_length = max_length
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        # Thread that drives the browser (None: any); drain() elsewhere leaves the sending to it
+        self.owner = None
+
+        self.__pending = deque()  # batches still open for coalescing
+        self.__ready = deque()  # (chatName, text) pieces due to be sent
+        self.__tokens = burst
+        self.__refilledAt = clock()
+
+    def put(self, text, chatName=None):
+        """Queue text for a chat (None: whichever chat is open when it is sent)"""
+        text = (text or "").strip()
+        if not text:
+            return
+        now = self.clock()
+        with self.lock:
+            last = self.__pending[-1] if self.__pending else None
+            if (last and last['chat'] == chatName and now - last['at'] < self.coalesce_seconds
+                    and last['length'] + 2 + len(text) <= self.max_length):
+                last['parts'].append(text)
+                last['length'] += 2 + len(text)
+                last['at'] = now
+            else:
+                self.__pending.append({'chat': chatName, 'parts': [text], 'length': len(text), 'at': now})
+
+    def __len__(self):
+        with self.lock:
+            return len(self.__pending) + len(self.__ready)
+
+    def __promote(self, force):
+        # Batches nobody added to for a whole window are closed and split into sendable pieces
+        now = self.clock()
+        while self.__pending and (force or now - self.__pending[0]['at'] >= self.coalesce_seconds):
+            batch = self.__pending.popleft()
+            for chunk in split_message("\n\n".join(batch['parts']), self.max_length):
+                self.__ready.append((batch['chat'], chunk))
+
+    def __refill(self):
+        now = self.clock()
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__refilledAt) * self.rate)
+        self.__refilledAt = now
+
+    def drain(self, force=False):
+        """Send what is due while the rate allows and return how many messages went out.
+
+        With force, everything queued is sent, sleeping for the rate where needed.
+        """
+        if self.owner is not None and threading.current_thread() is not self.owner:
+            return 0
+        sent = 0
+        while True:
+            with self.lock:
+                self.__promote(force)
+                if not self.__ready:
+                    return sent
+                self.__refill()
+                if self.__tokens < 1:
+                    if not force:
+                        return sent
+                    delay = (1 - self.__tokens) / self.rate
+                else:
+                    delay = 0
+                    self.__tokens -= 1
+                    chatName, text = self.__ready.popleft()
+            if delay:
+                self.sleep(delay)
+                continue
+            try:
+                self.deliver(chatName, text)
+                sent += 1
+            except Exception as e:
+                print("[Outbox] Sending to {} failed: {}".format(chatName or "open chat", e))
@@ -0,0 +1,120 @@
+import threading
+import unittest
+
+from whatsapp_send import Outbox, split_message
+
+
+class _Clock:
+    """Manual time for the outbox: sleep() only moves the clock forward"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+class SplitMessageTest(unittest.TestCase):
+    def test_short_text_is_one_piece(self):
+        self.assertEqual(split_message("  hello  ", 10), ["hello"])
+
+    def test_prefers_paragraph_then_line_then_word(self):
+        self.assertEqual(split_message("aaaa bbb\ncc\n\ndddd", 16), ["aaaa bbb\ncc", "dddd"])
+        self.assertEqual(split_message("aaaa bb\ncccc dddd", 12), ["aaaa bb", "cccc dddd"])
+        self.assertEqual(split_message("aaaa bbbb cccc", 12), ["aaaa bbbb", "cccc"])
+
+    def test_hard_cut_without_a_boundary(self):
+        self.assertEqual(split_message("x" * 25, 10), ["x" * 10, "x" * 10, "x" * 5])
+
+    def test_pieces_stay_within_the_limit(self):
+        text = "\n\n".join("word " * n for n in range(1, 60))
+        pieces = split_message(text, 100)
+        self.assertTrue(all(len(piece) <= 100 for piece in pieces))
+        self.assertEqual(" ".join(" ".join(pieces).split()), " ".join(text.split()))
+
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.sent = []
+
+    def __outbox(self, **kwargs):
+        return Outbox(lambda chat, text: self.sent.append((chat, text)),
+                      clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_adjacent_messages_to_a_chat_are_coalesced(self):
+        outbox = self.__outbox(coalesce_seconds=1.0)
+        outbox.put("one", "Ann")
+        self.clock.now += 0.5
+        outbox.put("two", "Ann")
+        self.clock.now += 0.9
+        # Still open: the last put was under a window ago
+        self.assertEqual(outbox.drain(), 0)
+        self.clock.now += 0.1
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(self.sent, [("Ann", "one\n\ntwo")])
+
+    def test_other_chat_or_a_gap_starts_a_new_message(self):
+        outbox = self.__outbox(coalesce_seconds=1.0)
+        outbox.put("one", "Ann")
+        outbox.put("two", "Bob")
+        outbox.put("three", "Ann")
+        self.clock.now += 2
+        outbox.put("four", "Ann")
+        outbox.drain(force=True)
+        self.assertEqual(self.sent, [("Ann", "one"), ("Bob", "two"), ("Ann", "three"), ("Ann", "four")])
+
+    def test_coalescing_stops_at_the_length_limit(self):
+        outbox = self.__outbox(max_length=10)
+        outbox.put("12345", "Ann")
+        outbox.put("67890", "Ann")
+        outbox.drain(force=True)
+        self.assertEqual(self.sent, [("Ann", "12345"), ("Ann", "67890")])
+
+    def test_long_message_is_split(self):
+        outbox = self.__outbox(max_length=10)
+        outbox.put("aaaa bbbb cccc dddd", "Ann")
+        outbox.drain(force=True)
+        self.assertEqual(self.sent, [("Ann", "aaaa bbbb"), ("Ann", "cccc dddd")])
+
+    def test_token_bucket_paces_sends(self):
+        outbox = self.__outbox(coalesce_seconds=0, rate=2.0, burst=3)
+        for i in range(7):
+            outbox.put(str(i), "chat%d" % i)
+        self.assertEqual(outbox.drain(), 3)
+        self.clock.now += 0.5
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(len(outbox), 3)
+        # Forced: the rest goes out at the sustained rate, sleeping in between
+        self.assertEqual(outbox.drain(force=True), 3)
+        self.assertAlmostEqual(self.clock.slept, 1.5)
+        self.assertEqual([text for _, text in self.sent], [str(i) for i in range(7)])
+
+    def test_only_the_owner_thread_sends(self):
+        outbox = self.__outbox()
+        outbox.owner = threading.Thread(target=lambda: None)
+        outbox.put("hi", "Ann")
+        self.assertEqual(outbox.drain(force=True), 0)
+        outbox.owner = threading.current_thread()
+        self.assertEqual(outbox.drain(force=True), 1)
+
+    def test_failed_delivery_does_not_stop_the_rest(self):
+        def deliver(chat, text):
+            if text == "bad":
+                raise RuntimeError("chat not found")
+            self.sent.append((chat, text))
+
+        outbox = Outbox(deliver, coalesce_seconds=0, clock=self.clock, sleep=self.clock.sleep)
+        outbox.put("bad", "Ann")
+        outbox.put("good", "Bob")
+        self.assertEqual(outbox.drain(force=True), 1)
+        self.assertEqual(self.sent, [("Bob", "good")])
+
+
+if __name__ == "__main__":
+    unittest.main()